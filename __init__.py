@@ -1,10 +1,11 @@
 from .deflicker import FossielVideoDeflicker
-from .dpks import FossielDenoisePrecisionKSampler
+from .dpks import FossielDenoisePrecisionKSampler, FossielDenoisePrecisionKSamplerSweep, FossielDualStageKSampler
 from .fccl import FossielCentralControlLite
 from .fcc_v2 import FossielCentralControl_v2
 from .lvl_m import FossielLevelMatcher
 from .resw import FossielResolutionWrangler
 from .reswxp import FossielResolutionWranglerXP
+from .reswb import FossielResolutionWranglerBuckets
 from .seqw import FossielSequenceWrangler
 from .webpw import FossielWebPWrangler
 from .senswitch import (
@@ -29,9 +30,12 @@ NODE_CLASS_MAPPINGS = {
     "FossielCentralControlLite": FossielCentralControlLite,
     "FossielCentralControl_v2": FossielCentralControl_v2,
     "FossielDenoisePrecisionKSampler": FossielDenoisePrecisionKSampler,
+    "FossielDenoisePrecisionKSamplerSweep": FossielDenoisePrecisionKSamplerSweep,
+    "FossielDualStageKSampler": FossielDualStageKSampler,
     "FossielLevelMatcher": FossielLevelMatcher,
     "FossielResolutionWrangler": FossielResolutionWrangler,
     "FossielResolutionWranglerXP": FossielResolutionWranglerXP,
+    "FossielResolutionWranglerBuckets": FossielResolutionWranglerBuckets,
     "Fossiel_Sensor_Switch_Image": FossielSensorSwitchImage,
     "Fossiel_Sensor_Switch_Clip": FossielSensorSwitchClip,
     "Fossiel_Sensor_Switch_Conditioning": FossielSensorSwitchConditioning,
@@ -54,9 +58,12 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "FossielCentralControlLite": "Fossiel Central Control Lite",
     "FossielCentralControl_v2": "Fossiel Central Control v2",
     "FossielDenoisePrecisionKSampler": "Denoise Precision KSampler",
+    "FossielDenoisePrecisionKSamplerSweep": "Denoise Precision KSampler (Sweep)",
+    "FossielDualStageKSampler": "Dual Stage KSampler",
     "FossielLevelMatcher": "Image Level Matcher",
     "FossielResolutionWrangler": "Resolution Wrangler",
     "FossielResolutionWranglerXP": "Resolution Wrangler (Express)",
+    "FossielResolutionWranglerBuckets": "Resolution Wrangler (Buckets)",
     "Fossiel_Sensor_Switch_Image": "Sensor Switch Image",
     "Fossiel_Sensor_Switch_Clip": "Sensor Switch Clip",
     "Fossiel_Sensor_Switch_Conditioning": "Sensor Switch Conditioning",
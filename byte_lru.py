@@ -0,0 +1,73 @@
+# Byte-budget LRU shared by the sampler noise cache and the frame loaders' decoded-frame cache
+import threading
+from collections import OrderedDict
+
+
+class ByteBudgetLRU:
+    """
+    LRU mapping bounded by a byte budget, with hit/miss counters. Subclasses define _size(value).
+    Thread-safe (the frame loaders decode in thread pools). Cached values are shared – treat them as read-only.
+    """
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        raise NotImplementedError
+
+    def request_budget(self, max_bytes):
+        """Grow the budget to max_bytes. Never shrinks: nodes sharing the cache get the largest budget any of them asked for."""
+        with self._lock:
+            self.max_bytes = max(self.max_bytes, max_bytes)
+
+    def clear(self):
+        """Drop every entry and the budget (until the next request_budget)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.max_bytes = 0
+
+    def _evict(self):
+        while self._entries and self._bytes > self.max_bytes:
+            _, value = self._entries.popitem(last=False)
+            self._bytes -= self._size(value)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = self._size(value)
+        with self._lock:
+            if size > self.max_bytes or key in self._entries:
+                return
+            self._entries[key] = value
+            self._bytes += size
+            self._evict()
+
+    def reset_counters(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -1,6 +1,241 @@
+import heapq
+import json
+import math
+import os
+import re
 import numpy as np
 import cv2
 import torch
+import folder_paths
+
+# ITU-R BT.601 luma weights (same as cv2.COLOR_RGB2GRAY)
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+# Approximate luma stats look at roughly this many pixels per frame
+HISTOGRAM_SAMPLES = 256 * 256
+
+# Input limits of window_size and overlap – a stored state tail never needs more frames than this
+MAX_WINDOW_SIZE = 1000
+MAX_OVERLAP = 1000
+
+# Central Control's "Current Gen" naming suffix (e.g. "_Gen003"), stripped from state keys
+GENERATION_SUFFIX = re.compile(r"[^A-Za-z0-9]?Gen\d{3,}$")
+
+
+def frame_brightness(images, mode, stats="exact"):
+    """
+    Per-frame brightness (B,) of a (B, H, W, C) batch in 0-1 float.
+    Computed for the whole batch at once and on the input device.
+    stats = "histogram" estimates mean/median from a 256-bin histogram of a strided
+    subsample, so the cost no longer grows with the frame size.
+    """
+    weights = torch.tensor(LUMA_WEIGHTS, dtype=images.dtype, device=images.device)
+    if stats == "histogram":
+        return histogram_brightness(images, mode, weights)
+    if mode == "mean":
+        # Mean of a weighted channel sum == weighted sum of the channel means
+        return images[..., :3].mean(dim=(1, 2)) @ weights
+    luma = images[..., :3] @ weights
+    return luma.flatten(1).median(dim=1).values
+
+
+def histogram_brightness(images, mode, weights):
+    num_frames, height, width = images.shape[:3]
+    stride = max(1, int(math.sqrt(height * width / HISTOGRAM_SAMPLES)))
+    luma = images[:, ::stride, ::stride, :3] @ weights
+
+    # One bincount for the whole batch: frame i owns bins [i * 256, i * 256 + 255]
+    bins = (luma.flatten(1).clamp(0.0, 1.0) * 255).round_().long()
+    bins += torch.arange(num_frames, device=bins.device).unsqueeze(1) * 256
+    hist = torch.bincount(bins.flatten(), minlength=num_frames * 256).view(num_frames, 256).double()
+    count = hist[0].sum()
+    levels = torch.arange(256, dtype=torch.float64, device=hist.device) / 255.0
+
+    if mode == "mean":
+        return (hist @ levels) / count
+    # First level where the cumulative count reaches half of the samples
+    median_bin = (hist.cumsum(dim=1) < count / 2).sum(dim=1).clamp(max=255)
+    return levels[median_bin]
+
+
+class SlidingMedian:
+    """
+    Running median of a sliding window: two heaps with lazy deletion,
+    O(log w) per add/remove. Even counts average the two middle values (like np.median).
+    """
+
+    def __init__(self):
+        self._low = []       # max-heap (stored negated), lower half
+        self._high = []      # min-heap, upper half
+        self._delayed = {}   # value -> removals not yet popped from a heap
+        self._low_size = 0
+        self._high_size = 0
+
+    def __len__(self):
+        return self._low_size + self._high_size
+
+    def _prune(self, heap, sign):
+        while heap:
+            value = sign * heap[0]
+            if self._delayed.get(value, 0) == 0:
+                break
+            self._delayed[value] -= 1
+            heapq.heappop(heap)
+
+    def _rebalance(self):
+        if self._low_size > self._high_size + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._high_size -= 1
+            self._low_size += 1
+            self._prune(self._high, 1)
+
+    def add(self, value):
+        if not self._low or value <= -self._low[0]:
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+        self._rebalance()
+
+    def remove(self, value):
+        self._delayed[value] = self._delayed.get(value, 0) + 1
+        if value <= -self._low[0]:
+            self._low_size -= 1
+            if value == -self._low[0]:
+                self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            if value == self._high[0]:
+                self._prune(self._high, 1)
+        self._rebalance()
+
+    def median(self):
+        if self._low_size > self._high_size:
+            return -self._low[0]
+        return (-self._low[0] + self._high[0]) / 2.0
+
+
+def window_bounds(index, total, window_size, centered):
+    """Half-open range [start, end) of the frames that make up the window of frame index."""
+    if centered:
+        return max(0, index - (window_size - 1) // 2), min(total, index + window_size // 2 + 1)
+    return max(0, index - window_size + 1), index + 1
+
+
+def sliding_median(series, offset, window_size, centered):
+    """Window medians of series[offset:]; both window edges only move forward, so each value enters and leaves once."""
+    total = len(series)
+    window = SlidingMedian()
+    lo = hi = window_bounds(offset, total, window_size, centered)[0]
+    ref = []
+    for i in range(offset, total):
+        start, end = window_bounds(i, total, window_size, centered)
+        while hi < end:
+            window.add(series[hi])
+            hi += 1
+        while lo < start:
+            window.remove(series[lo])
+            lo += 1
+        ref.append(window.median())
+    return ref
+
+
+# Elements (frames × window × tiles) gathered at once by the vectorized tiled median
+MEDIAN_CHUNK_ELEMENTS = 1 << 24
+
+
+def windowed_median(values, offset, window_size, centered):
+    """
+    Window medians of values[offset:] for every column of a (T, K) tensor at once – the tiled series
+    is short but has thousands of columns. Windows are gathered in chunks of output frames, padded
+    with NaN (sorted last) where they are cut short at the edges; even counts average the two middle values.
+    """
+    total, columns = values.shape
+    idx = torch.arange(offset, total, device=values.device)
+    if centered:
+        start = (idx - (window_size - 1) // 2).clamp(min=0)
+        end = (idx + window_size // 2 + 1).clamp(max=total)
+    else:
+        start = (idx - window_size + 1).clamp(min=0)
+        end = idx + 1
+    taps = torch.arange(window_size, device=values.device)
+    ref = torch.empty((total - offset, columns), dtype=values.dtype, device=values.device)
+    step = max(1, MEDIAN_CHUNK_ELEMENTS // (window_size * columns))
+    for first in range(0, total - offset, step):
+        rows = start[first:first + step, None] + taps                      # (n, w)
+        valid = rows < end[first:first + step, None]
+        window = values[rows.clamp(max=total - 1)]                          # (n, w, K)
+        window = window.masked_fill(~valid[..., None], float("nan")).sort(dim=1).values
+        count = valid.sum(dim=1, keepdim=True)[..., None].expand(-1, 1, columns)
+        low = window.gather(1, (count - 1) // 2)
+        high = window.gather(1, count // 2)
+        ref[first:first + step] = ((low + high) / 2).squeeze(1)
+    return ref
+
+
+def rolling_reference(brightness, window_size, mode, history=None, centered=False):
+    """
+    Reference brightness for every frame, shape (B,) or (B, *blocks) for tiled stats.
+    Trailing: frame i uses frames max(0, i - window_size + 1) .. i, like the original history list.
+    Centered: the window is split around frame i, so the first frames get corrected too.
+    history: brightness of the frames preceding this series (oldest first), used to
+    seed the window so consecutive pieces of one clip line up seamlessly.
+    """
+    values = brightness.double()
+    num_frames = values.shape[0]
+    offset = 0
+    if history is not None and len(history) > 0:
+        history = history[-(window_size - 1):] if window_size > 1 else history[:0]
+        offset = history.shape[0]
+        values = torch.cat([history.to(values), values])
+    total = values.shape[0]
+
+    if mode == "mean":
+        # Rolling mean from a cumulative sum – one pass, no per-frame history
+        csum = torch.cat([torch.zeros_like(values[:1]), values.cumsum(0)])
+        idx = torch.arange(offset, total, device=values.device)
+        if centered:
+            start = (idx - (window_size - 1) // 2).clamp(min=0)
+            end = (idx + window_size // 2 + 1).clamp(max=total)
+        else:
+            start = (idx - window_size + 1).clamp(min=0)
+            end = idx + 1
+        span = (end - start).view(-1, *([1] * (values.dim() - 1)))
+        return (csum[end] - csum[start]) / span
+
+    if values.dim() > 1:
+        # Tiled: thousands of short series – one batched sort instead of a heap per tile
+        return windowed_median(values.reshape(total, -1), offset, window_size, centered).reshape(num_frames, *values.shape[1:])
+    ref = sliding_median(values.cpu().tolist(), offset, window_size, centered)
+    return torch.tensor(ref, dtype=torch.float64, device=values.device)
+
+
+def tile_grid_shape(height, width, tiles):
+    """Tile rows/cols: the longer side gets `tiles` blocks, the shorter side keeps the aspect."""
+    if width >= height:
+        return max(1, round(tiles * height / width)), tiles
+    return tiles, max(1, round(tiles * width / height))
+
+
+def tile_brightness(images, grid):
+    """Per-block mean luma (B, rows, cols) from an area-downsampled proxy of the batch."""
+    weights = torch.tensor(LUMA_WEIGHTS, dtype=images.dtype, device=images.device)
+    luma = (images[..., :3] @ weights).unsqueeze(1)
+    return torch.nn.functional.adaptive_avg_pool2d(luma, grid).squeeze(1)
+
+
+def brightness_gains(brightness, reference, strength):
+    """Multiplicative correction per frame; frames with zero brightness are left untouched."""
+    current = brightness.double()
+    gains = (reference / current.clamp(min=1e-12)) ** strength
+    return torch.where(current > 0, gains, torch.ones_like(gains))
+
 
 class FossielVideoDeflicker:
     @classmethod
@@ -8,9 +243,19 @@ class FossielVideoDeflicker:
         return {
             "required": {
                 "images": ("IMAGE",),  # ComfyUI image batch (B, H, W, C) tensor in 0-1 float
-                "window_size": ("INT", {"default": 10, "min": 1, "max": 100, "step": 1}),
+                "window_size": ("INT", {"default": 10, "min": 1, "max": MAX_WINDOW_SIZE, "step": 1}),
                 "mode": (["mean", "median"], {"default": "mean"}),
                 "strength": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 2.0, "step": 0.05}),
+                "engine": (["torch", "opencv"], {"default": "torch", "tooltip": "torch = batched, stays on the input device in float precision. opencv = original per-frame uint8 path"}),
+                "chunk_size": ("INT", {"default": 0, "min": 0, "max": 4096, "step": 1, "tooltip": "Frames processed per block by the torch engine (0 = whole batch). Lower values cap peak memory on long clips"}),
+                "window_type": (["trailing", "centered"], {"default": "trailing", "tooltip": "trailing = previous frames only (original behaviour). centered = frames on both sides, also corrects the start of the clip"}),
+                "luma_stats": (["exact", "histogram"], {"default": "exact", "tooltip": "histogram = approximate brightness from a 256-bin histogram of a strided subsample, constant cost per frame"}),
+                "scope": (["global", "tiled"], {"default": "global", "tooltip": "global = one gain per frame. tiled = per-block gain map, smoothed over time and upsampled bilinearly, for local flicker"}),
+                "tiles": ("INT", {"default": 8, "min": 2, "max": 64, "step": 1, "tooltip": "Number of blocks along the longer side in tiled scope"}),
+                "state_key": ("STRING", {"default": "", "multiline": False, "tooltip": "Carry the brightness window over to the next generation. Use a name that stays the same for every generation, e.g. Central Control's File_Name with Naming_Suffix = None (a trailing GenNNN suffix is ignored). Empty = off"}),
+                "overlap": ("INT", {"default": 0, "min": 0, "max": MAX_OVERLAP, "step": 1, "tooltip": "Leading frames of this clip that repeat the tail of the previous generation (Central Control's Overlap)"}),
+                "reset_state": ("BOOLEAN", {"default": False, "tooltip": "Start from an empty window and overwrite the stored state (connect First_Gen_Batch_Switch)"}),
+                "generation": ("INT", {"default": 1, "min": 1, "max": 100, "step": 1, "tooltip": "Generation of this clip (same value as Central Control's Current_Generation). The window is seeded from generation - 1 only, so re-queuing a generation never seeds from itself"}),
             }
         }
 
@@ -18,14 +263,115 @@ class FossielVideoDeflicker:
     FUNCTION = "deflicker_batch"
     CATEGORY = "Fossiel"
 
-    def deflicker_batch(self, images, window_size, mode, strength):
+    def deflicker_batch(self, images, window_size, mode, strength, engine="torch", chunk_size=0,
+                        window_type="trailing", luma_stats="exact", scope="global", tiles=8,
+                        state_key="", overlap=0, reset_state=False, generation=1):
+        if images.shape[0] == 0:
+            return (images,)
+
+        if engine == "opencv":
+            return (self._deflicker_opencv(images, window_size, mode, strength),)
+
+        grid = tile_grid_shape(images.shape[1], images.shape[2], tiles) if scope == "tiled" else None
+
+        # Seed the window with the previous generation's brightness, minus the frames
+        # this clip repeats (they are measured again here)
+        history = None
+        state_key = self._state_name(state_key)
+        if state_key and not reset_state and generation > 1:
+            history = self._load_state(state_key, mode, grid, generation - 1)
+            if history is not None and overlap > 0:
+                history = history[:max(0, history.shape[0] - overlap)]
+
+        output, brightness = self._deflicker_torch(images, window_size, mode, strength, chunk_size,
+                                                   centered=window_type == "centered", stats=luma_stats,
+                                                   grid=grid, history=history)
+        if state_key:
+            # The next generation only reads the last window_size - 1 + overlap frames
+            tail = min(window_size - 1 + overlap, MAX_WINDOW_SIZE - 1 + MAX_OVERLAP)
+            self._save_state(state_key, mode, grid, brightness[max(0, brightness.shape[0] - tail):], generation, reset_state)
+        return (output,)
+
+    def _deflicker_torch(self, images, window_size, mode, strength, chunk_size=0,
+                         centered=False, stats="exact", grid=None, history=None):
+        num_frames, height, width = images.shape[:3]
+        chunk = chunk_size if chunk_size > 0 else num_frames
+        blocks = [(start, min(start + chunk, num_frames)) for start in range(0, num_frames, chunk)]
+
+        # Pass 1: only one scalar per frame (or per tile) survives a block, so the whole series
+        # is kept – a centered window needs to look ahead across block boundaries
+        if grid is None:
+            brightness = torch.cat([frame_brightness(images[start:end], mode, stats) for start, end in blocks])
+        else:
+            brightness = torch.cat([tile_brightness(images[start:end], grid) for start, end in blocks])
+        reference = rolling_reference(brightness, window_size, mode, history=history, centered=centered)
+        gains = brightness_gains(brightness, reference, strength).to(images.dtype)
+
+        # Pass 2: single preallocated result; every block is written straight into it
+        output = torch.empty_like(images)
+        for start, end in blocks:
+            if grid is None:
+                gain = gains[start:end].view(-1, 1, 1, 1)
+            else:
+                gain = torch.nn.functional.interpolate(gains[start:end].unsqueeze(1), size=(height, width),
+                                                       mode="bilinear", align_corners=False)
+                gain = gain.permute(0, 2, 3, 1)
+            torch.mul(images[start:end], gain, out=output[start:end])
+            output[start:end].clamp_(0.0, 1.0)
+
+        return output, brightness
+
+    # ────────────────────────────────────────────────
+    # Cross-generation state (brightness tail of every generation, one small file each)
+    # ────────────────────────────────────────────────
+    def _state_name(self, state_key):
+        """Stored key: trimmed, without Central Control's GenNNN suffix, so every generation shares it."""
+        state_key = state_key.strip()
+        return GENERATION_SUFFIX.sub("", state_key) or state_key
+
+    def _state_dir(self, state_key):
+        safe_key = re.sub(r"[^\w\-. ]", "_", state_key)
+        return os.path.join(folder_paths.get_user_directory(), "fossiel_deflicker", safe_key)
+
+    def _read_state(self, path):
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"[VideoDeflicker] Could not read state {path}: {e} — starting fresh")
+            return None
+        return state if isinstance(state, dict) and isinstance(state.get("brightness"), list) else None
+
+    def _load_state(self, state_key, mode, grid, generation):
+        state = self._read_state(os.path.join(self._state_dir(state_key), f"{generation}.json"))
+        if state is None:
+            print(f"[VideoDeflicker] No stored state for generation {generation} of '{state_key}' — starting fresh")
+            return None
+        # A window measured with other settings would not line up with this clip
+        if state.get("mode") != mode or state.get("grid") != (list(grid) if grid else None):
+            print(f"[VideoDeflicker] State '{state_key}' was saved with different settings — starting fresh")
+            return None
+        return torch.tensor(state["brightness"], dtype=torch.float64)
+
+    def _save_state(self, state_key, mode, grid, brightness, generation, reset=False):
+        directory = self._state_dir(state_key)
+        os.makedirs(directory, exist_ok=True)
+        # Later generations were seeded from the clip this run replaces (a reset replaces all) – drop them
+        for name in os.listdir(directory):
+            stem, ext = os.path.splitext(name)
+            if ext == ".json" and stem.isdigit() and (reset or int(stem) > generation):
+                os.remove(os.path.join(directory, name))
+        state = {"mode": mode, "grid": list(grid) if grid else None, "brightness": brightness.double().cpu().tolist()}
+        with open(os.path.join(directory, f"{generation}.json"), "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    def _deflicker_opencv(self, images, window_size, mode, strength):
         # Convert ComfyUI batch tensor to numpy: (B, H, W, C) float32 0-1
         batch = images.cpu().numpy()
         num_frames = batch.shape[0]
 
-        if num_frames == 0:
-            return (images,)
-
         # Convert to uint8 for OpenCV (0-255)
         frames_uint8 = (batch * 255).astype(np.uint8)
 
@@ -71,6 +417,4 @@ class FossielVideoDeflicker:
 
         # Stack back into tensor
         output_batch = np.stack(output_frames)
-        output_tensor = torch.from_numpy(output_batch)
-
-        return (output_tensor,)
+        return torch.from_numpy(output_batch)
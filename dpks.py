@@ -1,11 +1,134 @@
+import json
+import math
+import os
+import re
+import time
 import torch
+import comfy.model_management
 import comfy.sample
 import comfy.samplers
 import comfy.utils
 import latent_preview
+from .byte_lru import ByteBudgetLRU
 
 
-def common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent, denoise=1.0, disable_noise=False, start_step=None, last_step=None, force_full_denoise=False):
+class NoiseCache(ByteBudgetLRU):
+    """
+    Process-wide LRU of prepared noise tensors, bounded by a byte budget.
+    Keyed on (seed, shape, dtype, batch_index), so re-queuing with only cfg/denoise/steps
+    changed skips the RNG and the allocation. Cached tensors are shared – treat them as read-only.
+    """
+
+    def _size(self, noise):
+        return noise.numel() * noise.element_size()
+
+    def prepare_noise(self, latent_image, seed, batch_inds=None):
+        key = (seed, tuple(latent_image.shape), str(latent_image.dtype),
+               tuple(batch_inds) if batch_inds is not None else None)
+        noise = self.get(key)
+        if noise is None:
+            noise = comfy.sample.prepare_noise(latent_image, seed, batch_inds)
+            self.put(key, noise)
+        return noise
+
+
+NOISE_CACHE = NoiseCache()
+
+
+def prepare_noise(latent_image, seed, batch_inds=None, noise_cache_mb=0):
+    """comfy.sample.prepare_noise, served from NOISE_CACHE when a budget (MB) is given."""
+    if noise_cache_mb <= 0:
+        return comfy.sample.prepare_noise(latent_image, seed, batch_inds)
+    return NOISE_CACHE.prepare_noise(latent_image, seed, batch_inds)
+
+
+def begin_noise_cache(noise_cache_mb=0, free=False):
+    """
+    Start one node execution: optionally free every cached tensor, grow the shared budget to this
+    node's (a node with 0 only bypasses the cache, it never evicts noise other samplers cached)
+    and start counting hits. Same rule as the frame loaders' cache.
+    """
+    if free:
+        NOISE_CACHE.clear()
+    NOISE_CACHE.request_budget(max(noise_cache_mb, 0) * 1024 * 1024)
+    NOISE_CACHE.reset_counters()
+
+
+def report_noise_cache(tag, noise_cache_mb=0):
+    """Print the hit rate of the last node execution (counters are reset by begin_noise_cache())."""
+    if noise_cache_mb <= 0:
+        return
+    stats = NOISE_CACHE.stats()
+    print(f"[{tag}] Noise cache: {stats['hits']} hits / {stats['misses']} misses, "
+          f"{stats['entries']} entries, {stats['bytes'] / (1024 * 1024):.1f} / {stats['max_bytes'] / (1024 * 1024):.0f} MB")
+
+
+class SamplingStats:
+    """
+    Opt-in timing for one sampling run: noise prep, per-step wall time (preview excluded),
+    total time and peak allocated CUDA memory. The first step of every sampling call also
+    contains model loading and conditioning setup, so it is kept apart from the step stats.
+    """
+
+    def __init__(self):
+        self.noise_prep_s = 0.0
+        self.total_s = 0.0
+        self.step_s = []
+        self.first_step_s = []  # setup + first step, one per sampling call
+        self._started = None
+        self._last = None
+        self._cuda = torch.cuda.is_available()
+
+    def _sync(self):
+        # Kernels run asynchronously – without a sync the steps would only measure the launch
+        if self._cuda:
+            torch.cuda.synchronize()
+
+    def start(self):
+        if self._cuda:
+            torch.cuda.reset_peak_memory_stats()
+        self._sync()
+        self._started = self._last = time.perf_counter()
+
+    def noise_prepared(self):
+        self.noise_prep_s = time.perf_counter() - self._started
+        self._last = time.perf_counter()
+
+    def wrap_callback(self, callback):
+        first = [True]
+
+        def timed_callback(step, x0, x, total_steps):
+            self._sync()
+            (self.first_step_s if first[0] else self.step_s).append(time.perf_counter() - self._last)
+            first[0] = False
+            if callback is not None:
+                callback(step, x0, x, total_steps)
+            self._last = time.perf_counter()
+        return timed_callback
+
+    def finish(self):
+        self._sync()
+        self.total_s = time.perf_counter() - self._started
+
+    def report(self, **settings):
+        sampled = sum(self.step_s)
+        peak = torch.cuda.max_memory_allocated() / (1024 * 1024) if self._cuda else None
+        return {
+            **settings,
+            "total_s": round(self.total_s, 6),
+            "noise_prep_s": round(self.noise_prep_s, 6),
+            "setup_and_first_step_s": [round(t, 6) for t in self.first_step_s],
+            "step_s": [round(t, 6) for t in self.step_s],
+            "mean_step_s": round(sampled / len(self.step_s), 6) if self.step_s else None,
+            "steps_per_s": round(len(self.step_s) / sampled, 6) if sampled > 0 else None,
+            "peak_allocated_mb": round(peak, 2) if peak is not None else None,
+        }
+
+
+def common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent, denoise=1.0, disable_noise=False, start_step=None, last_step=None, force_full_denoise=False, noise_cache_mb=0, stats=None, max_sub_batch=0):
+    if stats is not None:
+        stats.start()
+
     latent_image = latent["samples"]
     latent_image = comfy.sample.fix_empty_latent_channels(model, latent_image)
 
@@ -13,21 +136,113 @@ def common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, positive,
         noise = torch.zeros(latent_image.size(), dtype=latent_image.dtype, layout=latent_image.layout, device="cpu")
     else:
         batch_inds = latent["batch_index"] if "batch_index" in latent else None
-        noise = comfy.sample.prepare_noise(latent_image, seed, batch_inds)
+        noise = prepare_noise(latent_image, seed, batch_inds, noise_cache_mb)
 
     noise_mask = None
     if "noise_mask" in latent:
         noise_mask = latent["noise_mask"]
 
-    callback = latent_preview.prepare_callback(model, steps)
-    disable_pbar = not comfy.utils.PROGRESS_BAR_ENABLED
-    samples = comfy.sample.sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image,
-                                  denoise=denoise, disable_noise=disable_noise, start_step=start_step, last_step=last_step,
-                                  force_full_denoise=force_full_denoise, noise_mask=noise_mask, callback=callback, disable_pbar=disable_pbar, seed=seed)
+    if stats is not None:
+        stats.noise_prepared()
+
+    if 0 < max_sub_batch < latent_image.shape[0]:
+        # The noise above covers the whole batch, so every chunk starts from the full-batch noise
+        # (stochastic samplers still differ – see sample_sub_batches)
+        samples = sample_sub_batches(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image,
+                                     denoise=denoise, disable_noise=disable_noise, start_step=start_step, last_step=last_step,
+                                     force_full_denoise=force_full_denoise, noise_mask=noise_mask, seed=seed,
+                                     max_sub_batch=max_sub_batch, stats=stats)
+    else:
+        callback = latent_preview.prepare_callback(model, steps)
+        if stats is not None:
+            callback = stats.wrap_callback(callback)
+        disable_pbar = not comfy.utils.PROGRESS_BAR_ENABLED
+        samples = comfy.sample.sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image,
+                                      denoise=denoise, disable_noise=disable_noise, start_step=start_step, last_step=last_step,
+                                      force_full_denoise=force_full_denoise, noise_mask=noise_mask, callback=callback, disable_pbar=disable_pbar, seed=seed)
+    if stats is not None:
+        stats.finish()
     out = latent.copy()
     out["samples"] = samples
     return (out, )
 
+def sample_sub_batches(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image,
+                       denoise=1.0, disable_noise=False, start_step=None, last_step=None, force_full_denoise=False,
+                       noise_mask=None, seed=0, max_sub_batch=0, out=None, stats=None):
+    """
+    Sample latent_image in chunks of at most max_sub_batch items (0 = all at once).
+    noise must already cover the full batch so every item gets the same initial noise as in one big run;
+    with deterministic samplers the result then matches a full-batch run. Stochastic samplers draw
+    per-step noise per call (seed, chunk size), so chunked results differ from a full-batch run.
+    Each chunk is written into out (preallocated here if not given).
+    """
+    total = latent_image.shape[0]
+    size = max_sub_batch if max_sub_batch > 0 else total
+    if size < total and is_stochastic_sampler(sampler_name):
+        print(f"[DenoisePrecisionKSampler] {sampler_name} adds noise during sampling – "
+              f"results of max_sub_batch={max_sub_batch} will differ from a full-batch run")
+    if out is None:
+        out = torch.empty(latent_image.shape, dtype=latent_image.dtype, device=comfy.model_management.intermediate_device())
+
+    disable_pbar = not comfy.utils.PROGRESS_BAR_ENABLED
+    for start in range(0, total, size):
+        end = min(start + size, total)
+        mask = noise_mask
+        if mask is not None and mask.shape[0] == total:
+            mask = mask[start:end]
+        callback = latent_preview.prepare_callback(model, steps)
+        if stats is not None:
+            callback = stats.wrap_callback(callback)
+        samples = comfy.sample.sample(model, noise[start:end], steps, cfg, sampler_name, scheduler, positive, negative, latent_image[start:end],
+                                      denoise=denoise, disable_noise=disable_noise, start_step=start_step, last_step=last_step,
+                                      force_full_denoise=force_full_denoise, noise_mask=mask, callback=callback, disable_pbar=disable_pbar, seed=seed)
+        out[start:end] = samples
+        del samples
+    return out
+
+
+# Samplers that draw fresh noise during sampling from the seed, sized to the batch they are given
+STOCHASTIC_SAMPLER_HINTS = ("ancestral", "sde", "ddpm", "lcm", "seeds_", "sa_solver", "restart")
+
+
+def is_stochastic_sampler(sampler_name):
+    """True if the sampler injects per-step noise, so results depend on the seed and batch of each sampling call."""
+    return any(hint in sampler_name for hint in STOCHASTIC_SAMPLER_HINTS)
+
+
+def unload_model(model):
+    """Unload one ModelPatcher's weights from its device; every other loaded model (CLIP, VAE, ...) stays loaded."""
+    loaded_models = comfy.model_management.current_loaded_models
+    for i, loaded in enumerate(loaded_models):
+        if loaded.model is model:
+            loaded_models.pop(i).model_unload()
+            break
+    comfy.model_management.soft_empty_cache()
+
+
+def parse_sweep(text, cast=float):
+    """
+    Parse a sweep definition: comma separated values and/or inclusive ranges "start-end:step"
+    (step defaults to 1). E.g. "40, 45, 50-60:2.5" or "0-7". Empty string → [].
+    """
+    values = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r"([\d.]+)\s*-\s*([\d.]+)(?:\s*:\s*([\d.]+))?", part)
+        if not match:
+            values.append(cast(part))
+            continue
+        start, end = cast(match.group(1)), cast(match.group(2))
+        step = cast(match.group(3)) if match.group(3) else cast(1)
+        if step <= 0:
+            raise ValueError(f"Sweep step must be greater than 0: '{part}'")
+        count = int(math.floor((end - start) / step + 1e-9)) + 1
+        values.extend(cast(round(start + i * step, 6)) for i in range(max(0, count)))
+    return values
+
+
 class FossielDenoisePrecisionKSampler:
     @classmethod
     def INPUT_TYPES(s):
@@ -50,17 +265,176 @@ class FossielDenoisePrecisionKSampler:
                     "round": 0.000001,  # Allows many decimals in display/input
                     "tooltip": "Displayed as percentage-like (100.0 = full denoise, 1.0 = 0.01, 0.01 = 0.0001)"
                 }),
+                "noise_cache_mb": ("INT", {"default": 0, "min": 0, "max": 65536, "tooltip": "Keep prepared noise for repeated seeds in memory, up to this many MB (0 = off for this node). The cache is shared by every sampler and keeps the largest budget any of them asked for"}),
+                "max_sub_batch": ("INT", {"default": 0, "min": 0, "max": 4096, "tooltip": "Maximum latents per sampling call (0 = whole batch). Lower values cap peak memory. Results match a full-batch run for deterministic samplers only (not ancestral/SDE)"}),
+                "instrumentation": ("BOOLEAN", {"default": False, "tooltip": "Record per-step time, total time, noise prep time and peak memory to the stats output"}),
+                "instrumentation_log": ("STRING", {"default": "", "multiline": False, "tooltip": "Optional file to append every stats record to (one JSON object per line)"}),
+                "free_noise_cache": ("BOOLEAN", {"default": False, "tooltip": "Drop every tensor in the shared noise cache (all samplers) before sampling, and reset its budget"}),
             }
         }
 
-    RETURN_TYPES = ("LATENT",)
+    RETURN_TYPES = ("LATENT", "STRING")
+    RETURN_NAMES = ("LATENT", "stats")
     FUNCTION = "sample"
     CATEGORY = "sampling"
 
-    def sample(self, model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, denoise=100.0):
+    def sample(self, model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, denoise=100.0,
+               noise_cache_mb=0, max_sub_batch=0, instrumentation=False, instrumentation_log="", free_noise_cache=False):
         # Convert displayed value to actual denoise (divide by 100)
         actual_denoise = denoise / 100.0
         # Optional: clamp just in case
         actual_denoise = max(0.0, min(1.0, actual_denoise))
 
-        return common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, denoise=actual_denoise)
+        begin_noise_cache(noise_cache_mb, free_noise_cache)
+        stats = SamplingStats() if instrumentation else None
+        (out,) = common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, denoise=actual_denoise,
+                                 noise_cache_mb=noise_cache_mb, stats=stats, max_sub_batch=max_sub_batch)
+        report_noise_cache("DenoisePrecisionKSampler", noise_cache_mb)
+        if stats is None:
+            return (out, "")
+
+        report = json.dumps(stats.report(
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), sampler_name=sampler_name, scheduler=scheduler,
+            steps=steps, cfg=cfg, denoise=denoise, seed=seed, latent_shape=list(latent_image["samples"].shape),
+        ))
+        print(f"[DenoisePrecisionKSampler] {report}")
+        if instrumentation_log.strip():
+            with open(os.path.expanduser(instrumentation_log.strip()), "a", encoding="utf-8") as f:
+                f.write(report + "\n")
+        return (out, report)
+
+
+class FossielDenoisePrecisionKSamplerSweep:
+    @classmethod
+    def INPUT_TYPES(s):
+        inputs = FossielDenoisePrecisionKSampler.INPUT_TYPES()
+        # Instrumentation covers a single sampling run only
+        inputs["required"].pop("instrumentation")
+        inputs["required"].pop("instrumentation_log")
+        inputs["required"].update({
+            "denoise_sweep": ("STRING", {"default": "", "multiline": False, "tooltip": "Denoise percentages to run, e.g. '40, 50, 60' or '40-60:5'. Empty = use denoise"}),
+            "seed_sweep": ("STRING", {"default": "", "multiline": False, "tooltip": "Seeds to run, e.g. '0, 7, 42' or '0-7'. Empty = use seed"}),
+            "max_sub_batch": ("INT", {"default": 0, "min": 0, "max": 4096, "tooltip": "Maximum latents per sampling call (0 = no limit). Lower values cap memory. With ancestral/SDE samplers chunked results differ from unchunked ones"}),
+        })
+        # Keep the newest input last, so saved sweep workflows keep their widget order
+        inputs["required"]["free_noise_cache"] = inputs["required"].pop("free_noise_cache")
+        return inputs
+
+    RETURN_TYPES = ("LATENT", "STRING")
+    RETURN_NAMES = ("LATENT", "sweep_values")
+    FUNCTION = "sample"
+    CATEGORY = "sampling"
+
+    def sample(self, model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, denoise=100.0,
+               noise_cache_mb=0, denoise_sweep="", seed_sweep="", max_sub_batch=0, free_noise_cache=False):
+        denoise_values = parse_sweep(denoise_sweep, float) or [denoise]
+        seeds = parse_sweep(seed_sweep, int) or [seed]
+
+        image = comfy.sample.fix_empty_latent_channels(model, latent_image["samples"])
+        batch_inds = latent_image["batch_index"] if "batch_index" in latent_image else None
+        batch = image.shape[0]
+        repeat_dims = (1,) * (image.dim() - 1)
+
+        # Every seed gets exactly the initial noise a normal run with that seed would use
+        begin_noise_cache(noise_cache_mb, free_noise_cache)
+        noise = torch.cat([prepare_noise(image, s, batch_inds, noise_cache_mb) for s in seeds])
+        report_noise_cache("DenoisePrecisionKSamplerSweep", noise_cache_mb)
+        images = image.repeat((len(seeds),) + repeat_dims)
+        noise_mask = latent_image.get("noise_mask")
+        if noise_mask is not None and noise_mask.shape[0] == batch:
+            noise_mask = noise_mask.repeat((len(seeds),) + (1,) * (noise_mask.dim() - 1))
+
+        # Each denoise value has its own sigma schedule, so it is its own sampling pass
+        per_pass = images.shape[0]
+        output = torch.empty((len(denoise_values) * per_pass,) + tuple(image.shape[1:]),
+                             dtype=image.dtype, device=comfy.model_management.intermediate_device())
+        # Stochastic samplers draw their per-step noise from the call's seed, so each seed needs its
+        # own call to match a normal run; deterministic samplers only use the initial noise and can share one
+        groups = [(0, per_pass, seeds[0])]
+        if is_stochastic_sampler(sampler_name) and len(seeds) > 1:
+            groups = [(j * batch, (j + 1) * batch, s) for j, s in enumerate(seeds)]
+        labels = []
+        for i, value in enumerate(denoise_values):
+            actual_denoise = max(0.0, min(1.0, value / 100.0))
+            for start, end, group_seed in groups:
+                mask = noise_mask[start:end] if noise_mask is not None and noise_mask.shape[0] == per_pass else noise_mask
+                sample_sub_batches(model, noise[start:end], steps, cfg, sampler_name, scheduler, positive, negative, images[start:end],
+                                   denoise=actual_denoise, noise_mask=mask, seed=group_seed, max_sub_batch=max_sub_batch,
+                                   out=output[i * per_pass + start:i * per_pass + end])
+            labels.extend(f"denoise={value}, seed={s}" for s in seeds for _ in range(batch))
+
+        out = latent_image.copy()
+        out.pop("batch_index", None)
+        out["samples"] = output
+        if noise_mask is not None and noise_mask.shape[0] == per_pass:
+            out["noise_mask"] = noise_mask.repeat((len(denoise_values),) + (1,) * (noise_mask.dim() - 1))
+        return (out, "\n".join(labels))
+
+
+class FossielDualStageKSampler:
+    """
+    Two KSampler (Advanced) passes in one node, split like FossielCentralControl_v2:
+    the high-noise model runs steps 0 → KSampler_1_End_Step and hands its leftover noise to
+    the low-noise model, which runs KSampler_2_Start_Step → end.
+    """
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "model_high_noise": ("MODEL", {"tooltip": "Model for the first (high-noise) stage."}),
+                "model_low_noise": ("MODEL", {"tooltip": "Model for the second (low-noise) stage."}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff, "control_after_generate": True}),
+                "steps": ("INT", {"default": 4, "min": 1, "max": 10000}),
+                "cfg": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 100.0, "step": 0.1, "round": 0.01}),
+                "sampler_name": (comfy.samplers.KSampler.SAMPLERS, ),
+                "scheduler": (comfy.samplers.KSampler.SCHEDULERS, ),
+                "positive": ("CONDITIONING", ),
+                "negative": ("CONDITIONING", ),
+                "latent_image": ("LATENT", ),
+                "KSampler_1_End_Step": ("INT", {"default": 2, "min": 0, "max": 10000, "tooltip": "Last step of the high-noise stage (Central Control output)"}),
+                "KSampler_2_Start_Step": ("INT", {"default": 2, "min": 0, "max": 10000, "tooltip": "First step of the low-noise stage (Central Control output)"}),
+                "release_stage_1": ("BOOLEAN", {"default": True, "tooltip": "Unload the high-noise model before the low-noise stage to keep peak memory down"}),
+                "noise_cache_mb": ("INT", {"default": 0, "min": 0, "max": 65536, "tooltip": "Keep prepared noise for repeated seeds in memory, up to this many MB (0 = off for this node). The cache is shared by every sampler and keeps the largest budget any of them asked for"}),
+                "free_noise_cache": ("BOOLEAN", {"default": False, "tooltip": "Drop every tensor in the shared noise cache (all samplers) before sampling, and reset its budget"}),
+            }
+        }
+
+    RETURN_TYPES = ("LATENT",)
+    FUNCTION = "sample"
+    CATEGORY = "sampling"
+
+    def sample(self, model_high_noise, model_low_noise, seed, steps, cfg, sampler_name, scheduler, positive, negative,
+               latent_image, KSampler_1_End_Step, KSampler_2_Start_Step, release_stage_1=True, noise_cache_mb=0,
+               free_noise_cache=False):
+        disable_pbar = not comfy.utils.PROGRESS_BAR_ENABLED
+        latent = comfy.sample.fix_empty_latent_channels(model_high_noise, latent_image["samples"])
+        batch_inds = latent_image["batch_index"] if "batch_index" in latent_image else None
+        begin_noise_cache(noise_cache_mb, free_noise_cache)
+        noise = prepare_noise(latent, seed, batch_inds, noise_cache_mb)
+        report_noise_cache("DualStageKSampler", noise_cache_mb)
+        noise_mask = latent_image.get("noise_mask")
+
+        # Stage 1: add noise, stop early and keep the leftover noise. comfy.samplers.KSampler directly
+        # (comfy.sample.sample would move the result to the intermediate device), so the
+        # intermediate latent stays on the sampling device for stage 2
+        sampler = comfy.samplers.KSampler(model_high_noise, steps=steps, device=model_high_noise.load_device,
+                                          sampler=sampler_name, scheduler=scheduler, denoise=1.0,
+                                          model_options=model_high_noise.model_options)
+        stage_1 = sampler.sample(noise, positive, negative, cfg=cfg, latent_image=latent, start_step=0,
+                                 last_step=KSampler_1_End_Step, force_full_denoise=False, denoise_mask=noise_mask,
+                                 callback=latent_preview.prepare_callback(model_high_noise, steps),
+                                 disable_pbar=disable_pbar, seed=seed)
+        del sampler, noise
+
+        if release_stage_1:
+            unload_model(model_high_noise)
+
+        # Stage 2: continue from the intermediate latent without new noise and finish denoising
+        samples = comfy.sample.sample(model_low_noise, torch.zeros_like(stage_1), steps, cfg, sampler_name, scheduler,
+                                      positive, negative, stage_1, denoise=1.0, disable_noise=True,
+                                      start_step=KSampler_2_Start_Step, last_step=10000, force_full_denoise=True,
+                                      noise_mask=noise_mask, callback=latent_preview.prepare_callback(model_low_noise, steps),
+                                      disable_pbar=disable_pbar, seed=seed)
+        out = latent_image.copy()
+        out["samples"] = samples
+        return (out,)
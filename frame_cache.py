@@ -0,0 +1,205 @@
+# Decode-time scaling and decoded-frame caches shared by FossielSequenceWrangler and FossielWebPWrangler
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+import torch
+from PIL import Image
+import folder_paths
+from .byte_lru import ByteBudgetLRU
+
+
+def decode_size(width, height, max_side=0):
+    """Frame size after decode-time scaling: longest side at most max_side, aspect kept, never upscaled (0 = off)."""
+    if max_side <= 0 or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def scales_to(width, height, size, max_side):
+    """
+    True if a width × height frame, scaled by its own decode_size, lands on size: same aspect (±1 px of
+    rounding) and never upscaled. Frames that don't would have to be stretched or enlarged to fit the batch.
+    """
+    w, h = decode_size(width, height, max_side)
+    return abs(w - size[0]) <= 1 and abs(h - size[1]) <= 1
+
+
+def draft(img, size):
+    """JPEG only: let the decoder scale by 1/2, 1/4 or 1/8 in the DCT domain (never below size). Call before loading."""
+    if img.format == "JPEG" and img.size != size:
+        img.draft(img.mode, size)
+
+
+def downscale(img, size):
+    """Resize a PIL image to size: integer reduce() first (cheap box filter), then Lanczos for the remainder."""
+    if img.size == size:
+        return img
+    factor = min(img.size[0] // size[0], img.size[1] // size[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img.resize(size, Image.LANCZOS)
+
+
+class FrameCache(ByteBudgetLRU):
+    """
+    Process-wide LRU of decoded frames, bounded by a byte budget.
+    Keyed on (path, mtime_ns, frame_index, decode size), so a changed file never hits stale frames.
+    Values are (uint8 RGB array, uint8 alpha array or None) – 4× smaller than the float32 batch.
+    """
+
+    def _size(self, frame):
+        rgb, alpha = frame
+        return rgb.nbytes + (alpha.nbytes if alpha is not None else 0)
+
+
+FRAME_CACHE = FrameCache()
+
+
+def cached_frame(key, decode, cache_mb=0):
+    """decode() → (rgb, alpha), served from FRAME_CACHE when a budget (MB) is given."""
+    if cache_mb <= 0:
+        return decode()
+    frame = FRAME_CACHE.get(key)
+    if frame is None:
+        frame = decode()
+        FRAME_CACHE.put(key, frame)
+    return frame
+
+
+def begin(cache_mb=0, free=False):
+    """
+    Start one load: optionally free every cached frame, grow the shared budget to this node's
+    (a node with 0 only bypasses the cache, it never evicts frames other loaders cached) and
+    start counting hits.
+    """
+    if free:
+        FRAME_CACHE.clear()
+    FRAME_CACHE.request_budget(max(cache_mb, 0) * 1024 * 1024)
+    FRAME_CACHE.reset_counters()
+
+
+def report(tag, cache_mb=0):
+    """Print the hit rate of the last load (counters are reset by begin())."""
+    if cache_mb <= 0:
+        return
+    stats = FRAME_CACHE.stats()
+    print(f"[{tag}] Frame cache: {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+          f"{stats['entries']} frames, {stats['bytes'] / (1024 * 1024):.1f} / {stats['max_bytes'] / (1024 * 1024):.0f} MB")
+
+
+DISK_CACHE_VERSION = 2
+
+
+class DiskFrameCache:
+    """
+    Opt-in on-disk cache of one source's decoded frames. Frames live in a flat file of uint8
+    (H, W, 4) slots that is memory-mapped for reading and only grows when a frame is first
+    stored; a small JSON index maps every frame key (file name, frame number) to its slot,
+    alpha flag and fingerprint (source size/mtime). A frame is valid only while its own
+    fingerprint matches, so appending frames to a sequence keeps every unchanged frame; a
+    changed frame is decoded again into its old slot. Frames that no longer exist are dropped
+    by prune(), which compacts the file once they take most of it. Another frame size recreates the cache.
+    """
+
+    def __init__(self, source, height, width):
+        directory = os.path.join(folder_paths.get_user_directory(), "fossiel_frame_cache")
+        os.makedirs(directory, exist_ok=True)
+        name = hashlib.sha1(source.encode("utf-8")).hexdigest()[:24]
+        self.path = os.path.join(directory, name + ".frames")
+        self.index_path = os.path.join(directory, name + ".json")
+        self.shape = (height, width, 4)
+        self.slot_bytes = height * width * 4
+        self._lock = threading.Lock()  # the sequence loader stores from worker threads
+        self._changed = False
+        index = self._read_index()
+        if index is None or index.get("version") != DISK_CACHE_VERSION or index.get("source") != source \
+                or index.get("shape") != list(self.shape) or not os.path.isfile(self.path):
+            index = {"version": DISK_CACHE_VERSION, "source": source, "shape": list(self.shape), "slots": 0, "frames": {}}
+            open(self.path, "wb").close()
+            self._changed = True
+        self.index = index
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def prune(self, live_keys):
+        """
+        Forget frames whose keys are gone (deleted or renamed files, a shorter animation) and compact the
+        file once orphaned slots outnumber live ones, so re-rendered sequences don't grow it without limit.
+        """
+        live_keys = set(live_keys)
+        frames = self.index["frames"]
+        stale = [key for key in frames if key not in live_keys]
+        for key in stale:
+            del frames[key]
+        if stale:
+            self._changed = True
+        if self.index["slots"] - len(frames) > len(frames):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the live slots to the front of a new file, in slot order, and swap it in."""
+        frames = self.index["frames"]
+        tmp = self.path + ".tmp"
+        with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+            for slot, entry in enumerate(sorted(frames.values(), key=lambda entry: entry["slot"])):
+                src.seek(entry["slot"] * self.slot_bytes)
+                dst.write(src.read(self.slot_bytes))
+                entry["slot"] = slot
+        os.replace(tmp, self.path)
+        self.index["slots"] = len(frames)
+        self._changed = True
+        self.save()
+
+    def missing(self, frames):
+        """frames: [(key, fingerprint)] → the ones without a valid cached copy."""
+        cached = self.index["frames"]
+        return [(key, fp) for key, fp in frames if key not in cached or cached[key]["fingerprint"] != fp]
+
+    def store(self, key, fp, rgb, alpha):
+        """Write one decoded frame (uint8 RGB, uint8 alpha or None) into its slot, growing the file for new keys."""
+        rgba = np.empty(self.shape, dtype=np.uint8)
+        rgba[..., :3] = rgb
+        rgba[..., 3] = 255 if alpha is None else alpha
+        with self._lock:
+            entry = self.index["frames"].get(key)
+            slot = entry["slot"] if entry is not None else self.index["slots"]
+            if entry is None:
+                self.index["slots"] += 1
+            with open(self.path, "r+b") as f:
+                f.seek(slot * self.slot_bytes)
+                f.write(rgba.tobytes())
+            self.index["frames"][key] = {"slot": slot, "alpha": alpha is not None, "fingerprint": fp}
+            self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+        self._changed = False
+
+    def read_into(self, keys, batch_rgb, batch_alpha, fallback_alpha):
+        """Frames for keys straight from the memory-mapped file into float32 batches (one division for the batch)."""
+        self.save()
+        frames = np.memmap(self.path, np.uint8, "c", 0, (self.index["slots"],) + self.shape)  # copy-on-write: writable views, file untouched
+        for i, key in enumerate(keys):
+            entry = self.index["frames"][key]
+            rgba = torch.from_numpy(np.asarray(frames[entry["slot"]]))  # view of the mapped file
+            batch_rgb[i].copy_(rgba[..., :3])
+            if entry["alpha"]:
+                batch_alpha[i].copy_(rgba[..., 3])
+            else:
+                batch_alpha[i].fill_(fallback_alpha * 255.0)
+        batch_rgb.div_(255.0)
+        batch_alpha.div_(255.0)
+        del frames
@@ -1,10 +1,8 @@
 import torch
 import math
 import numpy as np
-from fractions import Fraction
 from PIL import Image, ImageDraw, ImageFont
-from torchvision.transforms.functional import resize as tv_resize
-from torchvision.transforms import InterpolationMode
+from .resw_engine import crop_box, find_closest_ratio, largest_divisible_size, plan_resolution, resize_batch
 class FossielResolutionWrangler:
     """
     ResolutionWrangler - adapted for ComfyUI conventions:
@@ -32,8 +30,10 @@ class FossielResolutionWrangler:
                 "Ratio": ("FLOAT", {"default": 100.00, "min": 0.10, "max": 10000.00, "step": 0.01}),
                 "Aspect_tolerance": (["8", "16", "32", "64"], {"default": "8"}),
                 "Resizing_method": ([
-                    "nearest-exact", "bilinear", "bicubic", "lanczos"
+                    "nearest-exact", "bilinear", "bicubic", "lanczos", "lanczos (torch)"
                 ], {"default": "lanczos"}),
+                "Tile_size": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 64, "tooltip": "Resize in tiles of this many output pixels (0 = off). Keeps memory low for very large images"}),
+                "Build_outputs": (["All", "No RGBA", "Resized_Image only"], {"default": "All", "tooltip": "Skip building outputs you don't use. Skipped outputs return nothing, so only pick a reduced mode when they are unconnected"}),
             },
             "optional": {
                 "image": ("IMAGE",),
@@ -65,7 +65,7 @@ class FossielResolutionWrangler:
                 Aspect_method, Aspect_X, Aspect_Y,
                 Crop_position, Resize_by, Max_Resolution_X, Max_Resolution_Y,
                 Ratio, Aspect_tolerance, Resizing_method,
-                image=None, mask=None):
+                Build_outputs="All", Tile_size=0, image=None, mask=None):
         tolerance = int(Aspect_tolerance)
         no_input = image is None
         if no_input:
@@ -76,7 +76,7 @@ class FossielResolutionWrangler:
         if image.shape[-1] != 3:
             raise ValueError("Input image must be RGB (3 channels).")
         # Prepare mask if connected **and size matches image**
-        mask_rgb = None
+        mask_channel = None
         if mask is not None:
             # Common dummy mask size in ComfyUI loaders
             if mask.shape[1:3] == (64, 64) and (image.shape[1:3] != (64, 64)):
@@ -89,94 +89,49 @@ class FossielResolutionWrangler:
                 if mask.shape[1:3] != image.shape[1:3]:
                     print(f"[ResolutionWrangler] Mask size {mask.shape[1:3]} does not match image {image.shape[1:3]} — ignoring mask")
                 else:
-                    mask_rgb = mask.unsqueeze(-1).repeat(1,1,1,3)
-        # Target aspect
-        if Aspect_method == "Manual":
-            target_num = Aspect_X
-            target_den = Aspect_Y
-        else:
-            target_num, target_den = self.find_closest_ratio(
-                image.shape[2], image.shape[1], max_side=24
-            )
-        # Crop to aspect
-        cropped_rgb, aspect_w, aspect_h = self.expand_and_crop(
-            image, target_num, target_den, Crop_position, Aspect_method
+                    mask_channel = mask.unsqueeze(-1)  # (B, H, W, 1) view – masks are cropped and resized as one channel
+        # Aspect, crop box, pixel cap and final size (memoized per input size + settings)
+        plan = plan_resolution(
+            image.shape[2], image.shape[1], Aspect_method, Aspect_X, Aspect_Y, Crop_position,
+            Resize_by, Max_Resolution_X, Max_Resolution_Y, Ratio, tolerance
         )
-        if aspect_w != 0 and aspect_h != 0:
-            gcd_crop = math.gcd(aspect_w, aspect_h)
-            target_num = aspect_w // gcd_crop
-            target_den = aspect_h // gcd_crop
+        target_num, target_den = plan.aspect_x, plan.aspect_y
+        aspect_w, aspect_h = plan.aspect_w, plan.aspect_h
+        final_w, final_h = plan.final_w, plan.final_h
+        # Crop to aspect
+        cropped_rgb = plan.crop(image)
         if no_input:
             cropped_rgb = self.add_placeholder_text(cropped_rgb, aspect_w, aspect_h)
-        cropped_pixels = aspect_w * aspect_h
-        # Determine effective pixel cap
-        if Resize_by == "Ratio":
-            multiplier = Ratio / 100.0
-            effective_pixel_cap = int(cropped_pixels * multiplier)
-        elif Resize_by == "Max Resolution x Ratio":
-            base_cap = Max_Resolution_X * Max_Resolution_Y
-            multiplier = Ratio / 100.0
-            effective_pixel_cap = int(base_cap * multiplier)
-        else:
-            effective_pixel_cap = Max_Resolution_X * Max_Resolution_Y
-        print(f"[ResolutionWrangler] Mode: {Resize_by} | Effective cap: {effective_pixel_cap}")
-        # Minimal divisible fallback size based on cropped aspect
-        min_w = target_num * tolerance
-        min_h = target_den * tolerance
-        min_pixels = min_w * min_h
-        # Downscale if oversized
-        base_w = aspect_w
-        base_h = aspect_h
-        if cropped_pixels > effective_pixel_cap or not (aspect_w % tolerance == 0 and aspect_h % tolerance == 0):
-            print(f"[ResolutionWrangler] Oversized ({cropped_pixels} > {effective_pixel_cap}) → downscaling")
-            max_units = min(
-                base_w // target_num,
-                base_h // target_den,
-                int((effective_pixel_cap ** 0.5) / max(target_num, target_den, 1))
-            )
-            while max_units > 0:
-                test_w = max_units * target_num
-                test_h = max_units * target_den
-                if test_w * test_h <= effective_pixel_cap:
-                    base_w = test_w
-                    base_h = test_h
-                    print(f"[ResolutionWrangler] Downscaled to {base_w}×{base_h}")
-                    break
-                max_units -= 1
-            # If downscale resulted in something smaller than min divisible
-            if base_w < min_w or base_h < min_h:
-                print(f"[ResolutionWrangler] Downscale too aggressive → fallback to minimal divisible {min_w}×{min_h}")
-                base_w = min_w
-                base_h = min_h
-        # Even if no downscale, ensure we start from at least minimal if going to upscale
-        base_w = max(base_w, min_w)
-        base_h = max(base_h, min_h)
-        # Upscale to largest divisible under cap
-        final_w, final_h = self.resize_to_divisible(
-            base_w, base_h, target_num, target_den, tolerance, effective_pixel_cap
-        )
+        print(f"[ResolutionWrangler] Mode: {Resize_by} | Effective cap: {plan.pixel_cap}")
+        if plan.downscaled:
+            print(f"[ResolutionWrangler] Downscaled to {plan.base_w}×{plan.base_h}")
         print(f"[ResolutionWrangler] Final size: {final_w} × {final_h}")
-        resized_rgb = self.resize_image(cropped_rgb, final_w, final_h, Resizing_method)
-        # Process mask
-        if mask_rgb is not None:
-            cropped_mask_rgb, _, _ = self.expand_and_crop(
-                mask_rgb, target_num, target_den, Crop_position, Aspect_method
-            )
-            resized_mask_rgb = self.resize_image(cropped_mask_rgb, final_w, final_h, Resizing_method)
-            resized_mask = resized_mask_rgb.mean(dim=-1).clamp_(0, 1)
-            aspect_mask = cropped_mask_rgb.mean(dim=-1).clamp_(0, 1)
-        else:
-            aspect_mask = torch.zeros((cropped_rgb.shape[0], aspect_h, aspect_w), dtype=cropped_rgb.dtype, device=cropped_rgb.device)
-            resized_mask = torch.zeros((resized_rgb.shape[0], final_h, final_w), dtype=resized_rgb.dtype, device=resized_rgb.device)
+        build_masks = Build_outputs != "Resized_Image only"
+        build_rgba = Build_outputs == "All"
+        batch = cropped_rgb.shape[0]
+        resized_rgb = self.resize_image(cropped_rgb, final_w, final_h, Resizing_method, Tile_size)
+        # Process mask (skipped entirely when no mask or RGBA output is built)
+        aspect_mask = resized_mask = None
+        if mask_channel is not None and (build_masks or build_rgba):
+            cropped_mask = plan.crop(mask_channel)
+            resized_mask = self.resize_image(cropped_mask, final_w, final_h, Resizing_method, Tile_size).squeeze(-1).clamp(0, 1)
+            aspect_mask = cropped_mask.squeeze(-1).clamp(0, 1)
+        elif build_masks:
+            aspect_mask = torch.zeros((batch, aspect_h, aspect_w), dtype=cropped_rgb.dtype, device=cropped_rgb.device)
+            resized_mask = torch.zeros((batch, final_h, final_w), dtype=resized_rgb.dtype, device=resized_rgb.device)
         # RGBA: invert mask for alpha
-        if mask is not None:
-            aspect_alpha = (1.0 - aspect_mask).unsqueeze(-1)
-            resized_alpha = (1.0 - resized_mask).unsqueeze(-1)
-        else:
-            aspect_alpha = torch.ones((cropped_rgb.shape[0], aspect_h, aspect_w, 1), dtype=cropped_rgb.dtype, device=cropped_rgb.device)
-            resized_alpha = torch.ones((resized_rgb.shape[0], final_h, final_w, 1), dtype=resized_rgb.dtype, device=resized_rgb.device)
-        aspect_rgba = torch.cat([cropped_rgb, aspect_alpha], dim=-1)
-        resized_rgba = torch.cat([resized_rgb, resized_alpha], dim=-1)
+        aspect_rgba = resized_rgba = None
+        if build_rgba:
+            if aspect_mask is not None:
+                aspect_alpha = (1.0 - aspect_mask).unsqueeze(-1)
+                resized_alpha = (1.0 - resized_mask).unsqueeze(-1)
+            else:
+                aspect_alpha = torch.ones((batch, aspect_h, aspect_w, 1), dtype=cropped_rgb.dtype, device=cropped_rgb.device)
+                resized_alpha = torch.ones((batch, final_h, final_w, 1), dtype=resized_rgb.dtype, device=resized_rgb.device)
+            aspect_rgba = torch.cat([cropped_rgb, aspect_alpha], dim=-1)
+            resized_rgba = torch.cat([resized_rgb, resized_alpha], dim=-1)
+        if not build_masks:
+            aspect_mask = resized_mask = None
         # Simplify aspect output
         gcd = math.gcd(target_num, target_den)
         out_aspect_x = target_num // gcd
@@ -196,8 +151,8 @@ class FossielResolutionWrangler:
             final_h
         )
     # ────────────────────────────────────────────────
-    # Unchanged helper methods (create_black_starter, add_placeholder_text,
-    # find_closest_ratio, expand_and_crop, resize_image)
+    # Helper methods (create_black_starter, add_placeholder_text,
+    # find_closest_ratio, expand_and_crop, resize_image) – planning and resizing live in resw_engine
     # ────────────────────────────────────────────────
     def create_black_starter(self, size=1024):
         h = w = size
@@ -247,148 +202,14 @@ class FossielResolutionWrangler:
         new_tensor = torch.from_numpy(new_arr).unsqueeze(0)
         return new_tensor
     def find_closest_ratio(self, width, height, max_side=24):
-        if width == 0 or height == 0:
-            return 1, 1
-        ratio = width / height
-        landscape = width > height
-        best_error = float('inf')
-        best_loss = float('inf')
-        best_a, best_b = 1, 1
-        def continued_fraction(r):
-            a = int(r)
-            yield a
-            frac = r - a
-            seen = set()
-            while frac > 1e-9 and len(seen) < 30:
-                if frac in seen: break
-                seen.add(frac)
-                r = 1 / frac
-                a = int(r)
-                yield a
-                frac = r - a
-        cf = list(continued_fraction(ratio))
-        convergents = []
-        p0, q0, p1, q1 = 0, 1, 1, 0
-        for a in cf:
-            p = a * p1 + p0
-            q = a * q1 + q0
-            convergents.append((p, q))
-            p0, q0, p1, q1 = p1, q1, p, q
-        for a, b in convergents:
-            if max(a, b) > max_side: continue
-            if landscape and a <= b: continue
-            if not landscape and b <= a: continue
-            g = math.gcd(a, b)
-            a_r, b_r = a // g, b // g
-            if a_r == 0 or b_r == 0: continue
-            error = abs(Fraction(a_r, b_r) - Fraction(width, height))
-            if landscape:
-                loss = abs(width - height * Fraction(a_r, b_r))
-            else:
-                loss = abs(height - width * Fraction(b_r, a_r))
-            if error < best_error or (abs(error - best_error) < 1e-10 and loss < best_loss):
-                best_error = error
-                best_loss = loss
-                best_a, best_b = a_r, b_r
-        if best_a == 1 and best_b == 1:
-            if landscape:
-                best_a, best_b = 4, 3
-            else:
-                if height > width * 2.5:
-                    best_a, best_b = 2, 3
-                elif height > width * 1.5:
-                    best_a, best_b = 3, 4
-                else:
-                    best_a, best_b = 3, 4
-        return best_a, best_b
+        return find_closest_ratio(width, height, max_side)
     def expand_and_crop(self, image, target_num, target_den, position, aspect_method):
         if len(image.shape) == 3:
             image = image.unsqueeze(0)
-        orig_h, orig_w = image.shape[1], image.shape[2]
-        if aspect_method == "Automatic" and orig_w == orig_h:
-            return image, orig_w, orig_h
-        orig_ratio = orig_w / orig_h
-        targ_ratio = target_num / target_den
-        if orig_ratio > targ_ratio:
-            fit_units = orig_h // target_den
-        else:
-            fit_units = orig_w // target_num
-        new_w = fit_units * target_num
-        new_h = fit_units * target_den
-        excess_w = orig_w - new_w
-        excess_h = orig_h - new_h
-        crop_left = crop_right = crop_top = crop_bottom = 0
-        if excess_w > 0:
-            if "Left" in position:
-                crop_right = excess_w
-            elif "Right" in position:
-                crop_left = excess_w
-            else:
-                crop_left = excess_w // 2
-                crop_right = excess_w - crop_left
-        if excess_h > 0:
-            if "Top" in position:
-                crop_bottom = excess_h
-            elif "Bottom" in position:
-                crop_top = excess_h
-            else:
-                crop_top = excess_h // 2
-                crop_bottom = excess_h - crop_top
-        cropped = image[
-            :, crop_top : orig_h - crop_bottom,
-            crop_left : orig_w - crop_right,
-            :
-        ]
-        cropped_h = cropped.shape[1]
-        cropped_w = cropped.shape[2]
-        if cropped_w != new_w or cropped_h != new_h:
-            raise ValueError(f"Crop mismatch: expected {new_w}×{new_h}, got {cropped_w}×{cropped_h}")
-        return cropped, cropped_w, cropped_h
+        top, bottom, left, right = crop_box(image.shape[2], image.shape[1], target_num, target_den, position, aspect_method)
+        return image[:, top:bottom, left:right], right - left, bottom - top
     def resize_to_divisible(self, base_w, base_h, aspect_num, aspect_den, tolerance, pixel_cap):
-        w = base_w
-        h = base_h
-        max_w, max_h = w, h
-        max_pixels = w * h
-        while True:
-            next_w = w + aspect_num
-            next_h = h + aspect_den
-            if next_w * next_h > pixel_cap:
-                break
-            w, h = next_w, next_h
-            if w % tolerance == 0 and h % tolerance == 0:
-                current_pixels = w * h
-                if current_pixels > max_pixels:
-                    max_w, max_h = w, h
-                    max_pixels = current_pixels
-        return max_w, max_h
-    def resize_image(self, image, target_w, target_h, method="lanczos"):
-        if len(image.shape) == 3:
-            image = image.unsqueeze(0)
-        channels = image.shape[-1]
-        if method == "lanczos":
-            arr = (image[0].cpu().numpy() * 255).round().astype(np.uint8)
-            if channels == 1:
-                if arr.shape[-1] == 1:
-                    arr = arr.squeeze(-1)
-                pil_img = Image.fromarray(arr, mode='L')
-            elif channels == 3:
-                pil_img = Image.fromarray(arr)
-            elif channels == 4:
-                pil_img = Image.fromarray(arr, mode='RGBA')
-            else:
-                raise ValueError(f"Unexpected channels {channels}")
-            resized_pil = pil_img.resize((target_w, target_h), Image.LANCZOS)
-            new_arr = np.array(resized_pil).astype(np.float32) / 255.0
-            if channels == 1:
-                new_arr = new_arr[..., np.newaxis]
-            return torch.from_numpy(new_arr).unsqueeze(0)
-        mode_map = {
-            "nearest-exact": InterpolationMode.NEAREST,
-            "bilinear": InterpolationMode.BILINEAR,
-            "bicubic": InterpolationMode.BICUBIC,
-        }
-        interpolation = mode_map.get(method, InterpolationMode.BICUBIC)
-        antialias = interpolation in [InterpolationMode.BILINEAR, InterpolationMode.BICUBIC]
-        img_c_h_w = image[0].permute(2, 0, 1)
-        resized = tv_resize(img_c_h_w, (target_h, target_w), interpolation=interpolation, antialias=antialias)
-        return resized.permute(1, 2, 0).unsqueeze(0)
+        return largest_divisible_size(base_w, base_h, aspect_num, aspect_den, tolerance, pixel_cap)
+    def resize_image(self, image, target_w, target_h, method="lanczos", tile=0):
+        # Every frame of the batch is resized (see resw_engine)
+        return resize_batch(image, target_w, target_h, method, tile=tile)
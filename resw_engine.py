@@ -0,0 +1,633 @@
+"""
+Shared resolution planning and resize engine for FossielResolutionWrangler, FossielResolutionWranglerXP
+and FossielResolutionWranglerBuckets.
+Resize functions work on ComfyUI batches (B, H, W, C) in 0-1 float and resize every frame.
+"""
+import math
+import os
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from fractions import Fraction
+from functools import lru_cache
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.transforms.functional import resize as tv_resize
+from torchvision.transforms import InterpolationMode
+
+PIL_MODES = {1: "L", 3: "RGB", 4: "RGBA"}
+
+TV_MODES = {
+    "nearest-exact": InterpolationMode.NEAREST,
+    "bilinear": InterpolationMode.BILINEAR,
+    "bicubic": InterpolationMode.BICUBIC,
+}
+
+
+def default_workers():
+    return max(1, os.cpu_count() or 1)
+
+
+def resize_batch(image, target_w, target_h, method="lanczos", workers=0, tile=0):
+    """Resize a whole (B, H, W, C) batch to (B, target_h, target_w, C). tile > 0 → bounded-memory tiled resize."""
+    if len(image.shape) == 3:
+        image = image.unsqueeze(0)
+    if tile > 0:
+        return resize_tiled(image, target_w, target_h, method, tile)
+    if method == "lanczos":
+        return resize_pil_lanczos(image, target_w, target_h, workers)
+    if method == "lanczos (torch)":
+        return resize_torch_lanczos(image, target_w, target_h)
+    return resize_torchvision(image, target_w, target_h, method)
+
+
+def resize_pil_lanczos(image, target_w, target_h, workers=0):
+    """
+    PIL Lanczos, one frame per thread-pool task. PIL releases the GIL while resampling,
+    so frames resize in parallel; each result is written into one preallocated output.
+    """
+    batch, channels = image.shape[0], image.shape[-1]
+    if channels not in PIL_MODES:
+        raise ValueError(f"Unexpected channels {channels}")
+    source = image.cpu()
+    output = torch.empty((batch, target_h, target_w, channels), dtype=torch.float32)
+
+    def resize_frame(i):
+        arr = (source[i].numpy() * 255).round().astype(np.uint8)
+        if channels == 1:
+            arr = arr[..., 0]
+        pil_img = Image.fromarray(arr, mode=PIL_MODES[channels])
+        resized = np.asarray(pil_img.resize((target_w, target_h), Image.LANCZOS))
+        if channels == 1:
+            resized = resized[..., np.newaxis]
+        output[i] = torch.from_numpy(resized.astype(np.float32) / 255.0)
+
+    if batch == 1:
+        resize_frame(0)
+    else:
+        with ThreadPoolExecutor(max_workers=min(batch, workers or default_workers())) as pool:
+            list(pool.map(resize_frame, range(batch)))
+    return output
+
+
+def resize_torchvision(image, target_w, target_h, method):
+    """torchvision interpolation over the whole (B, C, H, W) batch in a single call."""
+    interpolation = TV_MODES.get(method, InterpolationMode.BICUBIC)
+    antialias = interpolation in [InterpolationMode.BILINEAR, InterpolationMode.BICUBIC]
+    resized = tv_resize(image.permute(0, 3, 1, 2), (target_h, target_w), interpolation=interpolation, antialias=antialias)
+    return resized.permute(0, 2, 3, 1)
+
+
+# ────────────────────────────────────────────────
+# Resolution plan (aspect, crop box, pixel cap, final size)
+# ────────────────────────────────────────────────
+@lru_cache(maxsize=1024)
+def find_closest_ratio(width, height, max_side=24):
+    if width == 0 or height == 0:
+        return 1, 1
+    ratio = width / height
+    landscape = width > height
+    best_error = float('inf')
+    best_loss = float('inf')
+    best_a, best_b = 1, 1
+    def continued_fraction(r):
+        a = int(r)
+        yield a
+        frac = r - a
+        seen = set()
+        while frac > 1e-9 and len(seen) < 30:
+            if frac in seen: break
+            seen.add(frac)
+            r = 1 / frac
+            a = int(r)
+            yield a
+            frac = r - a
+    cf = list(continued_fraction(ratio))
+    convergents = []
+    p0, q0, p1, q1 = 0, 1, 1, 0
+    for a in cf:
+        p = a * p1 + p0
+        q = a * q1 + q0
+        convergents.append((p, q))
+        p0, q0, p1, q1 = p1, q1, p, q
+    for a, b in convergents:
+        if max(a, b) > max_side: continue
+        if landscape and a <= b: continue
+        if not landscape and b <= a: continue
+        g = math.gcd(a, b)
+        a_r, b_r = a // g, b // g
+        if a_r == 0 or b_r == 0: continue
+        error = abs(Fraction(a_r, b_r) - Fraction(width, height))
+        if landscape:
+            loss = abs(width - height * Fraction(a_r, b_r))
+        else:
+            loss = abs(height - width * Fraction(b_r, a_r))
+        if error < best_error or (abs(error - best_error) < 1e-10 and loss < best_loss):
+            best_error = error
+            best_loss = loss
+            best_a, best_b = a_r, b_r
+    if best_a == 1 and best_b == 1:
+        if landscape:
+            best_a, best_b = 4, 3
+        else:
+            if height > width * 2.5:
+                best_a, best_b = 2, 3
+            elif height > width * 1.5:
+                best_a, best_b = 3, 4
+            else:
+                best_a, best_b = 3, 4
+    return best_a, best_b
+
+
+def crop_box(orig_w, orig_h, target_num, target_den, position, aspect_method):
+    """Largest target_num:target_den box inside the image, placed by Crop_position → (top, bottom, left, right)."""
+    if aspect_method == "Automatic" and orig_w == orig_h:
+        return 0, orig_h, 0, orig_w
+    if orig_w / orig_h > target_num / target_den:
+        fit_units = orig_h // target_den
+    else:
+        fit_units = orig_w // target_num
+    excess_w = orig_w - fit_units * target_num
+    excess_h = orig_h - fit_units * target_den
+    if "Left" in position:
+        crop_left = 0
+    elif "Right" in position:
+        crop_left = excess_w
+    else:
+        crop_left = excess_w // 2
+    if "Top" in position:
+        crop_top = 0
+    elif "Bottom" in position:
+        crop_top = excess_h
+    else:
+        crop_top = excess_h // 2
+    return crop_top, crop_top + orig_h - excess_h, crop_left, crop_left + orig_w - excess_w
+
+
+def effective_pixel_cap(resize_by, cropped_pixels, max_x, max_y, ratio):
+    if resize_by == "Ratio":
+        return int(cropped_pixels * ratio / 100.0)
+    if resize_by == "Max Resolution x Ratio":
+        return int(max_x * max_y * ratio / 100.0)
+    return max_x * max_y
+
+
+def largest_divisible_size(base_w, base_h, aspect_num, aspect_den, tolerance, pixel_cap):
+    """
+    Largest (base_w + k*aspect_num, base_h + k*aspect_den), k >= 1, that fits the pixel cap with both
+    sides divisible by tolerance; (base_w, base_h) if there is none. Closed form of the old
+    one-aspect-unit-at-a-time loop: solve the quadratic for the last k under the cap, then step
+    back to the nearest k whose residue mod tolerance makes both sides divisible.
+    """
+    def pixels(k):
+        return (base_w + k * aspect_num) * (base_h + k * aspect_den)
+
+    a = aspect_num * aspect_den
+    b = base_w * aspect_den + base_h * aspect_num
+    c = base_w * base_h - pixel_cap
+    disc = b * b - 4 * a * c
+    k_max = int((-b + math.isqrt(disc)) // (2 * a)) if disc >= 0 else 0
+    k_max = max(k_max, 0)
+    while k_max > 0 and pixels(k_max) > pixel_cap:
+        k_max -= 1
+    while pixels(k_max + 1) <= pixel_cap:
+        k_max += 1
+
+    best = 0
+    for r in range(tolerance):
+        if (base_w + r * aspect_num) % tolerance or (base_h + r * aspect_den) % tolerance:
+            continue
+        k = k_max - ((k_max - r) % tolerance)
+        best = max(best, k)
+    if best < 1:
+        return base_w, base_h
+    return base_w + best * aspect_num, base_h + best * aspect_den
+
+
+@dataclass(frozen=True)
+class ResolutionPlan:
+    aspect_x: int        # simplified aspect of the crop
+    aspect_y: int
+    crop_top: int
+    crop_bottom: int
+    crop_left: int
+    crop_right: int
+    aspect_w: int        # cropped size
+    aspect_h: int
+    pixel_cap: int
+    base_w: int          # start size of the upscale search
+    base_h: int
+    final_w: int
+    final_h: int
+    downscaled: bool
+
+    def crop(self, image):
+        """Crop a (B, H, W, C) batch; a view, no copy."""
+        return image[:, self.crop_top:self.crop_bottom, self.crop_left:self.crop_right]
+
+
+@lru_cache(maxsize=1024)
+def plan_resolution(width, height, aspect_method, aspect_x, aspect_y, crop_position,
+                    resize_by, max_x, max_y, ratio, tolerance):
+    """Everything the wranglers decide from the input size and settings, memoized per combination."""
+    if aspect_method == "Manual":
+        target_num, target_den = aspect_x, aspect_y
+    else:
+        target_num, target_den = find_closest_ratio(width, height, max_side=24)
+
+    top, bottom, left, right = crop_box(width, height, target_num, target_den, crop_position, aspect_method)
+    aspect_w, aspect_h = right - left, bottom - top
+    if aspect_w != 0 and aspect_h != 0:
+        gcd_crop = math.gcd(aspect_w, aspect_h)
+        target_num = aspect_w // gcd_crop
+        target_den = aspect_h // gcd_crop
+
+    cropped_pixels = aspect_w * aspect_h
+    pixel_cap = effective_pixel_cap(resize_by, cropped_pixels, max_x, max_y, ratio)
+
+    # Minimal divisible fallback size based on cropped aspect
+    min_w = target_num * tolerance
+    min_h = target_den * tolerance
+
+    # Downscale if oversized: the largest whole number of aspect units under the cap
+    base_w, base_h = aspect_w, aspect_h
+    downscaled = False
+    if cropped_pixels > pixel_cap or not (aspect_w % tolerance == 0 and aspect_h % tolerance == 0):
+        max_units = min(
+            base_w // target_num,
+            base_h // target_den,
+            int((pixel_cap ** 0.5) / max(target_num, target_den, 1)),
+            math.isqrt(max(pixel_cap, 0) // (target_num * target_den)),
+        )
+        if max_units > 0:
+            base_w, base_h = max_units * target_num, max_units * target_den
+            downscaled = True
+        # If downscale resulted in something smaller than min divisible
+        if base_w < min_w or base_h < min_h:
+            base_w, base_h = min_w, min_h
+
+    # Even if no downscale, ensure we start from at least minimal if going to upscale
+    base_w = max(base_w, min_w)
+    base_h = max(base_h, min_h)
+
+    # Upscale to largest divisible under cap
+    final_w, final_h = largest_divisible_size(base_w, base_h, target_num, target_den, tolerance, pixel_cap)
+
+    return ResolutionPlan(target_num, target_den, top, bottom, left, right, aspect_w, aspect_h,
+                          pixel_cap, base_w, base_h, final_w, final_h, downscaled)
+
+
+# ────────────────────────────────────────────────
+# Resolution pyramid (several sizes from one crop)
+# ────────────────────────────────────────────────
+PYRAMID_STEP = 2  # a level is resampled from a built level only if that one is at least this many times larger per side
+
+
+def parse_pyramid_levels(text, pixel_cap):
+    """
+    Pixel caps of the pyramid levels, in the order given: "50%" (of the main pixel cap),
+    "768x768" (width × height product) or a plain pixel count. E.g. "100%, 50%, 512x512". Empty string → [].
+    """
+    caps = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        try:
+            if part.endswith("%"):
+                caps.append(int(pixel_cap * float(part[:-1]) / 100.0))
+            elif "x" in part:
+                w, h = part.split("x")
+                caps.append(int(w) * int(h))
+            else:
+                caps.append(int(part))
+        except ValueError:
+            raise ValueError(f"Invalid pyramid level '{part}' – use e.g. 50%, 768x768 or 262144")
+    return caps
+
+
+def level_size(aspect_num, aspect_den, tolerance, pixel_cap):
+    """Largest size of the exact aspect under pixel_cap with both sides divisible by tolerance (minimal size if none fits)."""
+    return largest_divisible_size(aspect_num * tolerance, aspect_den * tolerance, aspect_num, aspect_den, tolerance, pixel_cap)
+
+
+def resize_pyramid(cropped, sizes, method="lanczos", tile=0, built=None):
+    """
+    Resize one cropped batch to every (w, h) in sizes; returns the batches in the order given.
+    Levels are built largest first and each one is resampled from the smallest already built level
+    that is at least PYRAMID_STEP× larger per side (so every downscale step stays well filtered),
+    otherwise from the crop itself. built: {(w, h): batch} of levels that already exist (e.g. the main output).
+    """
+    built = dict(built or {})
+    for w, h in sorted(set(sizes), key=lambda size: size[0] * size[1], reverse=True):
+        if (w, h) in built:
+            continue
+        sources = [size for size in built if size[0] >= PYRAMID_STEP * w and size[1] >= PYRAMID_STEP * h]
+        source = built[min(sources, key=lambda size: size[0] * size[1])] if sources else cropped
+        built[(w, h)] = resize_batch(source, w, h, method, tile=tile)
+    return [built[size] for size in sizes]
+
+
+# ────────────────────────────────────────────────
+# Aspect-ratio buckets (mixed-size image sets)
+# ────────────────────────────────────────────────
+@dataclass(frozen=True)
+class Bucket:
+    aspect_x: int
+    aspect_y: int
+    width: int           # shared output size of every member
+    height: int
+    members: tuple       # frame indices, in input order
+
+
+@lru_cache(maxsize=1024)
+def nearest_bucket_ratio(width, height, max_side=24):
+    """
+    Reduced a:b with max(a, b) <= max_side (1:1 included) closest to width:height in log space,
+    so the same relative error counts the same for landscape and portrait. Ties go to the smaller terms.
+    Unlike find_closest_ratio there is no landscape/portrait fallback: near-square sizes land in 1:1.
+    """
+    if width <= 0 or height <= 0:
+        return 1, 1
+    target = math.log(width / height)
+    candidates = ((a, b) for a in range(1, max_side + 1) for b in range(1, max_side + 1) if math.gcd(a, b) == 1)
+    return min(candidates, key=lambda ab: (abs(target - math.log(ab[0] / ab[1])), max(ab)))
+
+
+def plan_buckets(sizes, max_x, max_y, tolerance, max_side=24):
+    """
+    Group (width, height) sizes by their nearest small-integer aspect; every bucket gets the
+    largest size of that exact aspect under the shared max_x × max_y cap. Buckets are in order of first appearance.
+    """
+    members = {}
+    for index, (w, h) in enumerate(sizes):
+        members.setdefault(nearest_bucket_ratio(w, h, max_side), []).append(index)
+    buckets = []
+    for (num, den), indices in members.items():
+        width, height = level_size(num, den, tolerance, max_x * max_y)
+        buckets.append(Bucket(num, den, width, height, tuple(indices)))
+    return buckets
+
+
+def resize_bucket(frames, bucket, crop_position, method="lanczos", tile=0):
+    """
+    Crop every member frame (H, W, C) of a bucket to its aspect and resize it into one preallocated
+    (N, height, width, C) batch. Members of the same input size are stacked, so each
+    distinct size costs a single batched resize.
+    """
+    first = frames[bucket.members[0]]
+    output = torch.empty((len(bucket.members), bucket.height, bucket.width, first.shape[-1]),
+                         dtype=torch.float32, device=first.device)
+    by_shape = {}
+    for position, index in enumerate(bucket.members):
+        by_shape.setdefault(tuple(frames[index].shape), []).append(position)
+    for (h, w, _), positions in by_shape.items():
+        top, bottom, left, right = crop_box(w, h, bucket.aspect_x, bucket.aspect_y, crop_position, "Manual")
+        batch = torch.stack([frames[bucket.members[p]][top:bottom, left:right] for p in positions])
+        resized = resize_batch(batch, bucket.width, bucket.height, method, tile=tile)
+        output[positions] = resized.to(device=output.device, dtype=output.dtype)
+    return output
+
+
+# ────────────────────────────────────────────────
+# Torch-native separable Lanczos-3
+# ────────────────────────────────────────────────
+LANCZOS_A = 3
+
+
+def _lanczos(x, a=LANCZOS_A):
+    return torch.where(x.abs() < a, torch.sinc(x) * torch.sinc(x / a), torch.zeros_like(x))
+
+
+def _bicubic(x, a=-0.5):
+    x = x.abs()
+    near = ((a + 2) * x - (a + 3)) * x * x + 1
+    far = ((a * x - 5 * a) * x + 8 * a) * x - 4 * a
+    return torch.where(x < 1, near, torch.where(x < 2, far, torch.zeros_like(x)))
+
+
+def _triangle(x):
+    return (1 - x.abs()).clamp(min=0)
+
+
+# Separable filters (PIL definitions): name → (function, support in source pixels at scale 1)
+FILTERS = {
+    "lanczos": (_lanczos, LANCZOS_A),
+    "bicubic": (_bicubic, 2),
+    "bilinear": (_triangle, 1),
+}
+
+
+@lru_cache(maxsize=64)
+def filter_weights(src, dst, start, stop, kernel="lanczos"):
+    """
+    Banded weights of output pixels start..stop-1 when resampling src → dst pixels (PIL conventions:
+    pixel centers at +0.5, kernel widened by the scale when downscaling, rows renormalised at the borders).
+    Returns (weights (stop - start, taps), firsts (stop - start,)) on the CPU – output pixel i only reads
+    the source pixels firsts[i]..firsts[i]+taps-1, so memory and work follow dst × taps instead of dst × src.
+    """
+    fn, radius = FILTERS[kernel]
+    scale = src / dst
+    filterscale = max(scale, 1.0)
+    support = radius * filterscale
+    taps = min(src, int(math.ceil(2 * support)) + 1)
+    centers = (torch.arange(start, stop, dtype=torch.float64) + 0.5) * scale
+    firsts = (centers - support).floor().long().clamp_(0, src - taps)
+    positions = firsts.unsqueeze(1) + torch.arange(taps).unsqueeze(0)
+    weights = fn((positions.double() + 0.5 - centers.unsqueeze(1)) / filterscale)
+    weights = weights / weights.sum(dim=1, keepdim=True)
+    return weights.float(), firsts
+
+
+def _resample_axis(x, weights, firsts, axis):
+    """
+    Apply banded (dst, taps) weights along the height (axis=1) or width (axis=2) of (B, H, W, C).
+    Output pixels are done in chunks, so the gathered taps never take more memory than the input.
+    """
+    weights, firsts = weights.to(device=x.device, dtype=x.dtype), firsts.to(x.device)
+    count, taps = weights.shape
+    shape = list(x.shape)
+    shape[axis] = count
+    out = x.new_empty(shape)
+    chunk = max(1, x.shape[axis] // taps)
+    offsets = torch.arange(taps, device=x.device)
+    for s in range(0, count, chunk):
+        w = weights[s:s + chunk]
+        gathered = x.index_select(axis, (firsts[s:s + chunk, None] + offsets).flatten()).unflatten(axis, (w.shape[0], taps))
+        if axis == 1:
+            out[:, s:s + chunk] = torch.einsum("ot,botwc->bowc", w, gathered)
+        else:
+            out[:, :, s:s + chunk] = torch.einsum("ot,bhotc->bhoc", w, gathered)
+    return out
+
+
+def resize_torch_lanczos(image, target_w, target_h):
+    """
+    Separable Lanczos-3 over the whole batch with banded weights, on the tensor's device,
+    float32 end to end (no uint8 round trip).
+    """
+    if len(image.shape) == 3:
+        image = image.unsqueeze(0)
+    x = image.float()
+    src_h, src_w = x.shape[1], x.shape[2]
+    wy, first_y = filter_weights(src_h, target_h, 0, target_h, "lanczos")
+    wx, first_x = filter_weights(src_w, target_w, 0, target_w, "lanczos")
+
+    # Resample the axis that shrinks the intermediate most first
+    if target_h * src_w <= src_h * target_w:
+        x = _resample_axis(_resample_axis(x, wy, first_y, 1), wx, first_x, 2)
+    else:
+        x = _resample_axis(_resample_axis(x, wx, first_x, 2), wy, first_y, 1)
+    # Lanczos overshoots at hard edges; PIL clips the same way when writing uint8
+    return x.clamp_(0.0, 1.0)
+
+
+# ────────────────────────────────────────────────
+# Tiled resize for very large images
+# ────────────────────────────────────────────────
+def _nearest_indices(src, dst, start, stop, device):
+    # Same as torchvision / F.interpolate "nearest" (what the untiled path uses): floor(i * scale) in float32
+    scale = torch.tensor(src / dst, dtype=torch.float32)
+    idx = (torch.arange(start, stop, dtype=torch.float32) * scale).floor().long().clamp_(0, src - 1)
+    return idx.to(device)
+
+
+def resize_tiled(image, target_w, target_h, method="lanczos", tile=1024):
+    """
+    Resize tile by tile into one preallocated output. Every output tile reads only the source
+    window its kernel support reaches (weights are exact per row/column, so there are no seams),
+    and the image is never converted to uint8/PIL – extra memory follows the tile size.
+    bilinear/bicubic use the same kernels as the untiled torchvision antialias path (triangle,
+    cubic a=-0.5, widened when downscaling), nearest-exact the same floor indexing; lanczos is the
+    float32 kernel of "lanczos (torch)", so it differs from the 8-bit PIL path by rounding only.
+    """
+    if len(image.shape) == 3:
+        image = image.unsqueeze(0)
+    batch, src_h, src_w, channels = image.shape
+    kernel = "lanczos" if method.startswith("lanczos") else method
+    output = torch.empty((batch, target_h, target_w, channels), dtype=torch.float32, device=image.device)
+
+    for y0 in range(0, target_h, tile):
+        y1 = min(y0 + tile, target_h)
+        for x0 in range(0, target_w, tile):
+            x1 = min(x0 + tile, target_w)
+            if kernel in FILTERS:
+                wy, first_y = filter_weights(src_h, target_h, y0, y1, kernel)
+                wx, first_x = filter_weights(src_w, target_w, x0, x1, kernel)
+                top, left = int(first_y[0]), int(first_x[0])
+                window = image[:, top:int(first_y[-1]) + wy.shape[1], left:int(first_x[-1]) + wx.shape[1]].float()
+                out_tile = _resample_axis(_resample_axis(window, wy, first_y - top, 1), wx, first_x - left, 2)
+                if kernel == "lanczos":
+                    out_tile.clamp_(0.0, 1.0)
+            else:
+                rows = _nearest_indices(src_h, target_h, y0, y1, image.device)
+                cols = _nearest_indices(src_w, target_w, x0, x1, image.device)
+                out_tile = image[:, rows[:, None], cols].float()  # gathers only the tile's pixels
+            output[:, y0:y1, x0:x1] = out_tile
+            del out_tile
+    return output
+
+
+def benchmark_lanczos(batch=8, src=(1080, 1920), dst=(576, 1024), channels=3, repeats=3):
+    """Time the PIL Lanczos path against the torch kernel on random frames; returns seconds per run and max abs diff."""
+    image = torch.rand((batch, src[0], src[1], channels))
+    results = {}
+    for name, fn in (("pil", lambda: resize_pil_lanczos(image, dst[1], dst[0])),
+                     ("torch", lambda: resize_torch_lanczos(image, dst[1], dst[0]))):
+        fn()  # warm-up (thread pool, weight cache)
+        started = time.perf_counter()
+        for _ in range(repeats):
+            out = fn()
+        results[name] = ((time.perf_counter() - started) / repeats, out)
+    return {
+        "pil_s": results["pil"][0],
+        "torch_s": results["torch"][0],
+        "max_abs_diff": (results["pil"][1] - results["torch"][1]).abs().max().item(),
+    }
+
+
+def _rss_kb(field):
+    with open("/proc/self/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise OSError(field)
+
+
+def measure_peak(fn, device="cpu"):
+    """
+    Run fn once → (seconds, peak MB above the starting point, method, result).
+    CUDA: torch.cuda.max_memory_allocated. CPU on Linux: peak RSS (VmHWM, reset through
+    /proc/self/clear_refs), which sees torch, numpy and PIL buffers alike. Elsewhere: tracemalloc,
+    which only sees numpy/PIL allocations.
+    """
+    if str(device).startswith("cuda"):
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        base = torch.cuda.memory_allocated(device)
+        started = time.perf_counter()
+        result = fn()
+        torch.cuda.synchronize(device)
+        seconds = time.perf_counter() - started
+        return seconds, (torch.cuda.max_memory_allocated(device) - base) / (1024 * 1024), "cuda", result
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")  # resets VmHWM to the current RSS
+        base = _rss_kb("VmRSS")
+        started = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - started
+        return seconds, (_rss_kb("VmHWM") - base) / 1024, "rss", result
+    except OSError:
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return seconds, peak / (1024 * 1024), "tracemalloc", result
+
+
+def benchmark_mask_resize(batch=32, src=(1080, 1920), dst=(576, 1024), method="lanczos", device="cpu"):
+    """
+    Single-channel mask resize against the old path (mask replicated to 3 channels, resized,
+    averaged back). Returns measured seconds and peak memory (MB) per path and the max abs diff.
+    """
+    mask = torch.rand((batch, src[0], src[1]), device=device)
+
+    def replicated():
+        return resize_batch(mask.unsqueeze(-1).repeat(1, 1, 1, 3), dst[1], dst[0], method).mean(dim=-1)
+
+    def single():
+        return resize_batch(mask.unsqueeze(-1), dst[1], dst[0], method).squeeze(-1)
+
+    results = {}
+    for name, fn in (("replicated", replicated), ("single", single)):
+        fn()  # warm-up (thread pool, weight cache)
+        seconds, peak_mb, memory_method, out = measure_peak(fn, device)
+        results[name] = (seconds, peak_mb, out)
+    return {
+        "replicated_s": results["replicated"][0],
+        "single_s": results["single"][0],
+        "replicated_peak_mb": results["replicated"][1],
+        "single_peak_mb": results["single"][1],
+        "memory_method": memory_method,
+        "max_abs_diff": (results["replicated"][2].cpu() - results["single"][2].cpu()).abs().max().item(),
+    }
+
+
+if __name__ == "__main__":
+    for src, dst in (((1080, 1920), (576, 1024)), ((576, 1024), (1080, 1920))):
+        stats = benchmark_lanczos(src=src, dst=dst)
+        print(f"Lanczos {src[1]}x{src[0]} -> {dst[1]}x{dst[0]} (8 frames): "
+              f"PIL {stats['pil_s']:.3f}s | torch {stats['torch_s']:.3f}s | max diff {stats['max_abs_diff']:.4f}")
+    devices = ["cpu"] + (["cuda"] if torch.cuda.is_available() else [])
+    for device in devices:
+        for method in ("lanczos", "bilinear"):
+            stats = benchmark_mask_resize(method=method, device=device)
+            print(f"Mask {method} on {device} (32 x 1920x1080 -> 1024x576): "
+                  f"3-channel {stats['replicated_s']:.3f}s, peak {stats['replicated_peak_mb']:.0f} MB | "
+                  f"1-channel {stats['single_s']:.3f}s, peak {stats['single_peak_mb']:.0f} MB | "
+                  f"max diff {stats['max_abs_diff']:.4f} (memory: {stats['memory_method']})")
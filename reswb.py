@@ -0,0 +1,77 @@
+from .resw_engine import plan_buckets, resize_bucket
+
+class FossielResolutionWranglerBuckets:
+    """
+    ResolutionWrangler bucketing mode for lists of images of different sizes:
+    - Every frame is assigned to its closest small-integer aspect (max side 24)
+    - All buckets share one pixel cap; each bucket has one VAE-compatible size of its exact aspect
+    - Members of a bucket are cropped and resized into one batch (one batched resize per distinct input size)
+    - Outputs are lists, one entry per bucket, in order of first appearance
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "images": ("IMAGE",),
+                "Crop_position": ([
+                    "Left and Top", "Left and Y-Center", "Left and Bottom",
+                    "X-Center and Top", "Center", "X-Center and Bottom",
+                    "Right and Top", "Right and Y-Center", "Right and Bottom"
+                ], {"default": "Center"}),
+                "Max_Resolution_X": ("INT", {"default": 1024, "min": 64, "max": 16384, "step": 1}),
+                "Max_Resolution_Y": ("INT", {"default": 1024, "min": 64, "max": 16384, "step": 1}),
+                "Aspect_tolerance": (["8", "16", "32", "64"], {"default": "8"}),
+                "Resizing_method": ([
+                    "nearest-exact", "bilinear", "bicubic", "lanczos", "lanczos (torch)"
+                ], {"default": "lanczos"}),
+                "Tile_size": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 64, "tooltip": "Resize in tiles of this many output pixels (0 = off). Keeps memory low for very large images"}),
+            }
+        }
+
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("IMAGE", "STRING", "INT", "INT", "STRING")
+    RETURN_NAMES = (
+        "Bucket_Images",
+        "Bucket_Aspect",
+        "Bucket_X",
+        "Bucket_Y",
+        "Bucket_Indices"
+    )
+    OUTPUT_IS_LIST = (True, True, True, True, True)
+
+    FUNCTION = "wrangle"
+    CATEGORY = "utils"
+
+    def wrangle(self, images, Crop_position, Max_Resolution_X, Max_Resolution_Y,
+                Aspect_tolerance, Resizing_method, Tile_size):
+
+        # INPUT_IS_LIST: widgets arrive as one-item lists
+        Crop_position = Crop_position[0]
+        Max_Resolution_X = Max_Resolution_X[0]
+        Max_Resolution_Y = Max_Resolution_Y[0]
+        tolerance = int(Aspect_tolerance[0])
+        Resizing_method = Resizing_method[0]
+        Tile_size = Tile_size[0]
+
+        # Flatten the list of batches to frames (views, no copy)
+        frames = [frame for batch in images for frame in (batch if len(batch.shape) == 4 else batch.unsqueeze(0))]
+        if not frames:
+            raise ValueError("No images connected.")
+        if any(frame.shape[-1] != 3 for frame in frames):
+            raise ValueError("Input images must be RGB (3 channels).")
+
+        buckets = plan_buckets([(frame.shape[1], frame.shape[0]) for frame in frames],
+                               Max_Resolution_X, Max_Resolution_Y, tolerance)
+        print(f"[ResolutionWrangler] {len(frames)} frames → {len(buckets)} buckets")
+
+        bucket_images, aspects, widths, heights, indices = [], [], [], [], []
+        for bucket in buckets:
+            print(f"[ResolutionWrangler] Bucket {bucket.aspect_x}:{bucket.aspect_y} → {bucket.width} × {bucket.height} ({len(bucket.members)} frames)")
+            bucket_images.append(resize_bucket(frames, bucket, Crop_position, Resizing_method, Tile_size))
+            aspects.append(f"{bucket.aspect_x}:{bucket.aspect_y}")
+            widths.append(bucket.width)
+            heights.append(bucket.height)
+            indices.append(",".join(str(i) for i in bucket.members))
+
+        return (bucket_images, aspects, widths, heights, indices)
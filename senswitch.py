@@ -1,5 +1,48 @@
 import comfy.latent_formats
 
+
+def _connected_inputs(dynprompt, unique_id):
+    """
+    Return the names of the inputs that are actually linked on this node,
+    or None when the prompt graph is not available.
+    Lazy inputs that have not been evaluated yet arrive as None, exactly like
+    unconnected (or bypassed) ones, so the graph is the only way to tell them apart.
+    """
+    if dynprompt is None or unique_id is None:
+        return None
+    try:
+        node = dynprompt.get_node(unique_id)
+    except Exception:
+        return None
+    return set(node.get("inputs", {}).keys())
+
+
+def _lazy_branch(connected, switch, name_true, name_false, value_true, value_false):
+    """
+    Decide which of the two lazy inputs still has to be evaluated.
+    - Only one side connected → request that side (sensor behaviour)
+    - Both connected → request only the side selected by the switch
+    - Graph unknown → fall back to the side selected by the switch
+    """
+    if connected is None:
+        has_true = has_false = True
+    else:
+        has_true = name_true in connected
+        has_false = name_false in connected
+
+    if has_true and has_false:
+        wanted = name_true if switch else name_false
+    elif has_true:
+        wanted = name_true
+    elif has_false:
+        wanted = name_false
+    else:
+        return []
+
+    pending = value_true if wanted == name_true else value_false
+    return [wanted] if pending is None else []
+
+
 class FossielSensorSwitchImage:
     @classmethod
     def INPUT_TYPES(cls):
@@ -8,8 +51,12 @@ class FossielSensorSwitchImage:
                 "switch": ("BOOLEAN", {"default": True}),
             },
             "optional": {
-                "image_true": ("IMAGE",),
-                "image_false": ("IMAGE",),
+                "image_true": ("IMAGE", {"lazy": True}),
+                "image_false": ("IMAGE", {"lazy": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+                "dynprompt": "DYNPROMPT",
             }
         }
 
@@ -18,7 +65,11 @@ class FossielSensorSwitchImage:
     FUNCTION = "switch"
     CATEGORY = "Fossiel/QoL"
 
-    def switch(self, switch, image_true=None, image_false=None):
+    def check_lazy_status(self, switch, image_true=None, image_false=None, unique_id=None, dynprompt=None):
+        connected = _connected_inputs(dynprompt, unique_id)
+        return _lazy_branch(connected, switch, "image_true", "image_false", image_true, image_false)
+
+    def switch(self, switch, image_true=None, image_false=None, unique_id=None, dynprompt=None):
         if image_true is not None and image_false is None:
             return (image_true,)
         if image_false is not None and image_true is None:
@@ -35,8 +86,12 @@ class FossielSensorSwitchClip:
                 "switch": ("BOOLEAN", {"default": True}),
             },
             "optional": {
-                "clip_true": ("CLIP",),
-                "clip_false": ("CLIP",),
+                "clip_true": ("CLIP", {"lazy": True}),
+                "clip_false": ("CLIP", {"lazy": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+                "dynprompt": "DYNPROMPT",
             }
         }
 
@@ -45,7 +100,11 @@ class FossielSensorSwitchClip:
     FUNCTION = "switch"
     CATEGORY = "Fossiel/QoL"
 
-    def switch(self, switch, clip_true=None, clip_false=None):
+    def check_lazy_status(self, switch, clip_true=None, clip_false=None, unique_id=None, dynprompt=None):
+        connected = _connected_inputs(dynprompt, unique_id)
+        return _lazy_branch(connected, switch, "clip_true", "clip_false", clip_true, clip_false)
+
+    def switch(self, switch, clip_true=None, clip_false=None, unique_id=None, dynprompt=None):
         if clip_true is not None and clip_false is None:
             return (clip_true,)
         if clip_false is not None and clip_true is None:
@@ -62,8 +121,12 @@ class FossielSensorSwitchConditioning:
                 "switch": ("BOOLEAN", {"default": True}),
             },
             "optional": {
-                "conditioning_true": ("CONDITIONING",),
-                "conditioning_false": ("CONDITIONING",),
+                "conditioning_true": ("CONDITIONING", {"lazy": True}),
+                "conditioning_false": ("CONDITIONING", {"lazy": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+                "dynprompt": "DYNPROMPT",
             }
         }
 
@@ -72,7 +135,11 @@ class FossielSensorSwitchConditioning:
     FUNCTION = "switch"
     CATEGORY = "Fossiel/QoL"
 
-    def switch(self, switch, conditioning_true=None, conditioning_false=None):
+    def check_lazy_status(self, switch, conditioning_true=None, conditioning_false=None, unique_id=None, dynprompt=None):
+        connected = _connected_inputs(dynprompt, unique_id)
+        return _lazy_branch(connected, switch, "conditioning_true", "conditioning_false", conditioning_true, conditioning_false)
+
+    def switch(self, switch, conditioning_true=None, conditioning_false=None, unique_id=None, dynprompt=None):
         if conditioning_true is not None and conditioning_false is None:
             return (conditioning_true,)
         if conditioning_false is not None and conditioning_true is None:
@@ -92,8 +159,12 @@ class FossielSensorSwitchLatent:
                 "switch": ("BOOLEAN", {"default": True}),
             },
             "optional": {
-                "latent_true": ("LATENT",),
-                "latent_false": ("LATENT",),
+                "latent_true": ("LATENT", {"lazy": True}),
+                "latent_false": ("LATENT", {"lazy": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+                "dynprompt": "DYNPROMPT",
             }
         }
 
@@ -122,7 +193,11 @@ class FossielSensorSwitchLatent:
         result["samples"] = samples
         return result
 
-    def switch(self, switch, latent_true=None, latent_false=None):
+    def check_lazy_status(self, switch, latent_true=None, latent_false=None, unique_id=None, dynprompt=None):
+        connected = _connected_inputs(dynprompt, unique_id)
+        return _lazy_branch(connected, switch, "latent_true", "latent_false", latent_true, latent_false)
+
+    def switch(self, switch, latent_true=None, latent_false=None, unique_id=None, dynprompt=None):
         if latent_true is not None and latent_false is None:
             return (self._to_raw(latent_true),)
         if latent_false is not None and latent_true is None:
@@ -141,8 +216,12 @@ class FossielSensorSwitchMask:
                 "switch": ("BOOLEAN", {"default": True}),
             },
             "optional": {
-                "mask_true": ("MASK",),
-                "mask_false": ("MASK",),
+                "mask_true": ("MASK", {"lazy": True}),
+                "mask_false": ("MASK", {"lazy": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+                "dynprompt": "DYNPROMPT",
             }
         }
 
@@ -151,7 +230,11 @@ class FossielSensorSwitchMask:
     FUNCTION = "switch"
     CATEGORY = "Fossiel/QoL"
 
-    def switch(self, switch, mask_true=None, mask_false=None):
+    def check_lazy_status(self, switch, mask_true=None, mask_false=None, unique_id=None, dynprompt=None):
+        connected = _connected_inputs(dynprompt, unique_id)
+        return _lazy_branch(connected, switch, "mask_true", "mask_false", mask_true, mask_false)
+
+    def switch(self, switch, mask_true=None, mask_false=None, unique_id=None, dynprompt=None):
         if mask_true is not None and mask_false is None:
             return (mask_true,)
         if mask_false is not None and mask_true is None:
@@ -168,8 +251,12 @@ class FossielSensorSwitchModel:
                 "switch": ("BOOLEAN", {"default": True}),
             },
             "optional": {
-                "model_true": ("MODEL",),
-                "model_false": ("MODEL",),
+                "model_true": ("MODEL", {"lazy": True}),
+                "model_false": ("MODEL", {"lazy": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+                "dynprompt": "DYNPROMPT",
             }
         }
 
@@ -178,7 +265,11 @@ class FossielSensorSwitchModel:
     FUNCTION = "switch"
     CATEGORY = "Fossiel/QoL"
 
-    def switch(self, switch, model_true=None, model_false=None):
+    def check_lazy_status(self, switch, model_true=None, model_false=None, unique_id=None, dynprompt=None):
+        connected = _connected_inputs(dynprompt, unique_id)
+        return _lazy_branch(connected, switch, "model_true", "model_false", model_true, model_false)
+
+    def switch(self, switch, model_true=None, model_false=None, unique_id=None, dynprompt=None):
         if model_true is not None and model_false is None:
             return (model_true,)
         if model_false is not None and model_true is None:
@@ -195,8 +286,12 @@ class FossielSensorSwitchVAE:
                 "switch": ("BOOLEAN", {"default": True}),
             },
             "optional": {
-                "vae_true": ("VAE",),
-                "vae_false": ("VAE",),
+                "vae_true": ("VAE", {"lazy": True}),
+                "vae_false": ("VAE", {"lazy": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+                "dynprompt": "DYNPROMPT",
             }
         }
 
@@ -205,7 +300,11 @@ class FossielSensorSwitchVAE:
     FUNCTION = "switch"
     CATEGORY = "Fossiel/QoL"
 
-    def switch(self, switch, vae_true=None, vae_false=None):
+    def check_lazy_status(self, switch, vae_true=None, vae_false=None, unique_id=None, dynprompt=None):
+        connected = _connected_inputs(dynprompt, unique_id)
+        return _lazy_branch(connected, switch, "vae_true", "vae_false", vae_true, vae_false)
+
+    def switch(self, switch, vae_true=None, vae_false=None, unique_id=None, dynprompt=None):
         if vae_true is not None and vae_false is None:
             return (vae_true,)
         if vae_false is not None and vae_true is None:
@@ -225,14 +324,18 @@ class FossielSensorKSamplerSwitch:
                 "switch_latent": ("BOOLEAN", {"default": True}),
             },
             "optional": {
-                "model_true": ("MODEL",),
-                "model_false": ("MODEL",),
-                "positive_true": ("CONDITIONING",),
-                "positive_false": ("CONDITIONING",),
-                "negative_true": ("CONDITIONING",),
-                "negative_false": ("CONDITIONING",),
-                "latent_true": ("LATENT",),
-                "latent_false": ("LATENT",),
+                "model_true": ("MODEL", {"lazy": True}),
+                "model_false": ("MODEL", {"lazy": True}),
+                "positive_true": ("CONDITIONING", {"lazy": True}),
+                "positive_false": ("CONDITIONING", {"lazy": True}),
+                "negative_true": ("CONDITIONING", {"lazy": True}),
+                "negative_false": ("CONDITIONING", {"lazy": True}),
+                "latent_true": ("LATENT", {"lazy": True}),
+                "latent_false": ("LATENT", {"lazy": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+                "dynprompt": "DYNPROMPT",
             }
         }
 
@@ -256,13 +359,31 @@ class FossielSensorKSamplerSwitch:
         result["samples"] = samples
         return result
 
+    def check_lazy_status(self,
+                          switch_model,
+                          switch_positive, switch_negative, switch_latent,
+                          model_true=None, model_false=None,
+                          positive_true=None, positive_false=None,
+                          negative_true=None, negative_false=None,
+                          latent_true=None, latent_false=None,
+                          unique_id=None, dynprompt=None):
+        connected = _connected_inputs(dynprompt, unique_id)
+        # Each input group is resolved on its own switch
+        needed = []
+        needed += _lazy_branch(connected, switch_model, "model_true", "model_false", model_true, model_false)
+        needed += _lazy_branch(connected, switch_positive, "positive_true", "positive_false", positive_true, positive_false)
+        needed += _lazy_branch(connected, switch_negative, "negative_true", "negative_false", negative_true, negative_false)
+        needed += _lazy_branch(connected, switch_latent, "latent_true", "latent_false", latent_true, latent_false)
+        return needed
+
     def switch(self,
                switch_model,
                switch_positive, switch_negative, switch_latent,
                model_true=None, model_false=None,
                positive_true=None, positive_false=None,
                negative_true=None, negative_false=None,
-               latent_true=None, latent_false=None):
+               latent_true=None, latent_false=None,
+               unique_id=None, dynprompt=None):
 
         # === MODEL SWITCH ===
         if model_true is not None and model_false is None:
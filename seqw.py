@@ -1,9 +1,119 @@
 # FossielSequenceWrangler.py
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 import torch
 from PIL import Image
 import numpy as np
 from pathlib import Path
+from . import frame_cache
+
+SUPPORTED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tiff', '.tif', '.gif'}
+INDEX_SIDECAR = ".fossiel_seqw_index.json"
+INDEX_VERSION = 1
+
+
+def _has_alpha(img):
+    # Header only (mode, bands, info) – no pixel data is decoded here
+    return "A" in img.getbands() or "transparency" in img.info
+
+
+def _probe(path):
+    """Header info of one image file (PIL reads the header only – no pixel decode)."""
+    try:
+        with Image.open(path) as img:
+            suffix = os.path.splitext(path)[1].lower()
+            animated = suffix in {'.webp', '.gif'} and getattr(img, "is_animated", False) and img.n_frames > 1
+            return {
+                "width": img.size[0],
+                "height": img.size[1],
+                "mode": img.mode,
+                "has_alpha": _has_alpha(img),
+                "animated": bool(animated),
+            }
+    except Exception:
+        return {"width": None, "height": None, "mode": None, "has_alpha": None, "animated": False}
+
+
+class SequenceIndex:
+    """
+    File list plus per-file size/mtime and header info (dimensions, mode, alpha, animated) of one
+    directory. Built from one os.scandir pass; later refreshes only re-probe new or changed files,
+    and skip the directory listing while the directory mtime is unchanged.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.dir_mtime = None
+        self.entries = {}   # name → {"size", "mtime", "width", "height", "mode", "has_alpha", "animated"}
+        self.files = []     # sorted names
+        self.probed = 0     # files probed by the last refresh
+
+    def refresh(self, sidecar=False):
+        if sidecar and self.dir_mtime is None:
+            self._load_sidecar()
+        dir_mtime = os.stat(self.directory).st_mtime_ns
+        if dir_mtime == self.dir_mtime:
+            # Same listing – only file contents can have changed
+            stats = {}
+            for name in self.files:
+                try:
+                    stats[name] = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+        else:
+            with os.scandir(self.directory) as it:
+                stats = {entry.name: entry.stat() for entry in it
+                         if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS}
+
+        self.probed = 0
+        entries = {}
+        for name, st in stats.items():
+            entry = self.entries.get(name)
+            if entry is None or entry["size"] != st.st_size or entry["mtime"] != st.st_mtime_ns:
+                entry = {"size": st.st_size, "mtime": st.st_mtime_ns, **_probe(os.path.join(self.directory, name))}
+                self.probed += 1
+            entries[name] = entry
+        changed = self.probed > 0 or len(entries) != len(self.entries) or dir_mtime != self.dir_mtime
+        self.entries = entries
+        self.files = sorted(entries, key=str.lower)
+        self.dir_mtime = dir_mtime
+        if sidecar and changed:
+            self._save_sidecar()
+        return self
+
+    def _sidecar_path(self):
+        return os.path.join(self.directory, INDEX_SIDECAR)
+
+    def _load_sidecar(self):
+        try:
+            with open(self._sidecar_path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                # Entries are re-validated against size/mtime by refresh(); the listing is always re-read
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+
+    def _save_sidecar(self):
+        try:
+            with open(self._sidecar_path(), "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "entries": self.entries}, f)
+        except OSError:
+            pass  # read-only directory – the in-memory index still works
+
+
+SEQUENCE_INDEXES = {}
+
+
+def sequence_index(directory, sidecar=False):
+    """The (refreshed) index of a directory, cached per process."""
+    key = os.path.normcase(os.path.abspath(directory))
+    index = SEQUENCE_INDEXES.get(key)
+    if index is None:
+        index = SEQUENCE_INDEXES[key] = SequenceIndex(key)
+    return index.refresh(sidecar)
+
 
 class FossielSequenceWrangler:
     @classmethod
@@ -23,6 +133,12 @@ class FossielSequenceWrangler:
                 "Missing_Alpha_Handling": (["Opaque", "Transparent"], {"default": "Opaque"}),
                 "Index_1": ("INT", {"default": 0, "min": 0, "max": 10000}),
                 "Index_2": ("INT", {"default": 0, "min": 0, "max": 10000}),
+                "Decode_workers": ("INT", {"default": 0, "min": 0, "max": 64, "tooltip": "Frames decoded in parallel (0 = one per CPU core)"}),
+                "Frame_cache_MB": ("INT", {"default": 0, "min": 0, "max": 65536, "step": 256, "tooltip": "Keep decoded frames in RAM across runs (shared with WebP Wrangler, 0 = off for this node). The shared cache keeps the largest budget any loader asked for. Re-loading overlapping ranges only decodes new frames"}),
+                "Decode_max_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8, "tooltip": "Downscale while decoding so the longest side is at most this (0 = off). Frames of the first frame's aspect are brought to its scaled size, so mixed resolutions also load; other aspects, or frames smaller than that size, raise an error"}),
+                "Disk_cache": ("BOOLEAN", {"default": False, "tooltip": "Keep decoded frames in a memory-mapped file in the ComfyUI user directory (uncompressed – W×H×4 bytes per frame). Reloads skip decoding; changed files invalidate it"}),
+                "Index_sidecar": ("BOOLEAN", {"default": False, "tooltip": f"Also keep the directory index in {INDEX_SIDECAR} inside the sequence directory, so it survives restarts"}),
+                "Free_frame_cache": ("BOOLEAN", {"default": False, "tooltip": "Drop every frame in the shared RAM frame cache (all loaders) before this load, and reset its budget"}),
             }
         }
 
@@ -31,33 +147,24 @@ class FossielSequenceWrangler:
     FUNCTION = "load_image_sequence"
     CATEGORY = "Fossiel/QoL"
 
-    SUPPORTED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tiff', '.tif', '.gif'}
-
-    def _check_for_animated_files(self, directory: str):
-        """Reject directory if it contains any animated WebP or GIF"""
-        dir_path = Path(directory)          # <-- renamed to dir_path to avoid shadowing builtin
-        if not dir_path.is_dir():           # <-- now it's a real Path object
-            return
+    SUPPORTED_EXTENSIONS = SUPPORTED_EXTENSIONS
 
-        for file_path in dir_path.iterdir():
-            if not file_path.is_file():
-                continue
-            suffix = file_path.suffix.lower()
-            if suffix in {'.webp', '.gif'}:
-                try:
-                    with Image.open(file_path) as img:
-                        if getattr(img, "is_animated", False) and img.n_frames > 1:
-                            raise ValueError(
-                                f"Animated {suffix.upper()[1:]} file detected: {file_path.name}\n\n"
-                                "FossielSequenceWrangler does NOT support animated WebP/GIF files.\n"
-                                "This node loads sequences of individual static images only.\n"
-                                "Use FossielWebPWrangler for animated webp, or extract frames first."
-                            )
-                except Exception:
-                    pass  # Skip unreadable files silently during check
+    def _check_for_animated_files(self, index: SequenceIndex):
+        """Reject directory if it contains any animated WebP or GIF (from the index – no file is opened here)"""
+        for name in index.files:
+            if index.entries[name]["animated"]:
+                suffix = os.path.splitext(name)[1]
+                raise ValueError(
+                    f"Animated {suffix.upper()[1:]} file detected: {name}\n\n"
+                    "FossielSequenceWrangler does NOT support animated WebP/GIF files.\n"
+                    "This node loads sequences of individual static images only.\n"
+                    "Use FossielWebPWrangler for animated webp, or extract frames first."
+                )
 
     def load_image_sequence(self, Sequence_Dir: str, Load_Mode: str, Index_1: int, Index_2: int,
-                            Missing_Alpha_Handling: str = "Opaque"):
+                            Missing_Alpha_Handling: str = "Opaque", Decode_workers: int = 0,
+                            Frame_cache_MB: int = 0, Disk_cache: bool = False, Index_sidecar: bool = False,
+                            Decode_max_side: int = 0, Free_frame_cache: bool = False):
         if not Sequence_Dir:
             raise ValueError("Sequence_Dir is required")
 
@@ -65,15 +172,15 @@ class FossielSequenceWrangler:
         if not os.path.isdir(Sequence_Dir):
             raise ValueError(f"Path is not a directory: {Sequence_Dir}")
 
+        # Sorted image files + header info, from the cached directory index
+        index = sequence_index(Sequence_Dir, Index_sidecar)
+        if index.probed:
+            print(f"[SequenceWrangler] Indexed {index.probed} new/changed files ({len(index.files)} total)")
+
         # Safety check: no animated files allowed
-        self._check_for_animated_files(Sequence_Dir)
+        self._check_for_animated_files(index)
 
-        # Collect and sort image files
-        files = []
-        for ext in self.SUPPORTED_EXTENSIONS:
-            files.extend(Path(Sequence_Dir).glob(f'*{ext}'))
-            files.extend(Path(Sequence_Dir).glob(f'*{ext.upper()}'))
-        files = sorted(files, key=lambda x: x.name.lower())
+        files = [Path(index.directory) / name for name in index.files]
 
         if not files:
             raise ValueError(f"No supported image files found in: {Sequence_Dir}")
@@ -86,75 +193,144 @@ class FossielSequenceWrangler:
         else:  # "Transparent"
             fallback_alpha_value = 0.0
 
-        def load_frame(idx: int):
+        def load_frame(idx: int, size=None):
+            """One frame as (uint8 RGB array, uint8 alpha array or None), from the frame cache when enabled."""
             path = files[idx]
+            key = (str(path), index.entries[index.files[idx]]["mtime"], 0, size)
+            return frame_cache.cached_frame(key, lambda: decode_file(path, size), Frame_cache_MB)
+
+        def decode_file(path: Path, size=None):
+            """
+            Decode one file with a single open → (uint8 RGB array, uint8 alpha array or None if the file has no alpha).
+            size: (w, h) to scale to while decoding (JPEG draft, then reduce/resize) – None keeps the file's size.
+            """
             try:
                 with Image.open(path) as img:
-                    # Force RGBA – PIL will add alpha channel if missing
-                    img = img.convert("RGBA")
-                arr = np.array(img).astype(np.float32) / 255.0
+                    if size is not None:
+                        frame_cache.draft(img, size)
+                    if not _has_alpha(img):
+                        # e.g. JPEG / RGB PNG: direct RGB decode, alpha comes from Missing_Alpha_Handling
+                        rgb_img = img.convert("RGB")
+                        return np.array(rgb_img if size is None else frame_cache.downscale(rgb_img, size)), None
+                    bands = len(img.getbands())
+                    rgba_img = img.convert("RGBA")
+                    arr = np.array(rgba_img if size is None else frame_cache.downscale(rgba_img, size))
                 rgb = arr[..., :3]
                 alpha = arr[..., 3]
 
-                # Critical: if original image had no alpha (e.g. JPEG), PIL fills with 255
-                # We detect that case and replace with user's preferred fallback
-                if np.all(alpha == 1.0):  # very likely no real alpha channel
-                    # Double-check by re-opening in "RGB" mode – if size matches, it never had alpha
-                    try:
-                        with Image.open(path) as img_rgb:
-                            if img_rgb.mode in ("RGB", "L", "HSV", "P") or len(img_rgb.getbands()) < 4:
-                                alpha = np.full_like(alpha, fallback_alpha_value)
-                    except:
-                        pass  # fallback to detected value
-
-                return torch.from_numpy(rgb), torch.from_numpy(alpha)
+                # Palette / LA transparency that turns out fully opaque counts as no alpha (same as before);
+                # checked on uint8, no float plane
+                if bands < 4 and alpha.min() == 255:
+                    return rgb, None
+                return rgb, alpha
 
             except Exception as e:
                 raise RuntimeError(f"Failed to load image {path.name}: {str(e)}")
 
         def extract_frames(start: int, end: int):
-            rgb_frames = []
-            alpha_frames = []
-            for i in range(max(0, start), min(end, total_frames)):
-                rgb, alpha = load_frame(i)
-                rgb_frames.append(rgb)
-                alpha_frames.append(alpha)
-            return rgb_frames, alpha_frames
+            indices = range(max(0, start), min(end, total_frames))
+            if not indices:
+                return None, None
+            first = index.entries[index.files[indices[0]]]
+            width, height = first["width"], first["height"]
+            if width is None:
+                # Header probe failed – decoding raises with the file name (or recovers the size)
+                height, width = load_frame(indices[0])[0].shape[:2]
+            # Decode-time scaling: every frame is decoded straight to the first frame's scaled size, which
+            # only frames of the same aspect that are at least that large reach without stretching
+            size = None
+            if Decode_max_side > 0:
+                width, height = frame_cache.decode_size(width, height, Decode_max_side)
+                size = (width, height)
+            # Workers write straight into the batch – no per-frame list + torch.stack copy at the end
+            batch_rgb = torch.empty((len(indices), height, width, 3), dtype=torch.float32)
+            batch_alpha = torch.empty((len(indices), height, width), dtype=torch.float32)
+
+            disk = None
+            if Disk_cache:
+                disk = frame_cache.DiskFrameCache(
+                    index.directory if size is None else f"{index.directory}@{width}x{height}", height, width)
+                disk.prune(index.files)
+
+            def frame_key(i: int):
+                # Per-frame fingerprint: appending or changing one file keeps every other cached frame
+                name = index.files[i]
+                return name, [index.entries[name]["size"], index.entries[name]["mtime"]]
+
+            def decode(slot: int):
+                if size is not None:
+                    entry = index.entries[index.files[indices[slot]]]
+                    if entry["width"] is not None and not frame_cache.scales_to(entry["width"], entry["height"], size, Decode_max_side):
+                        raise RuntimeError(f"Frame {files[indices[slot]].name} is {entry['width']}×{entry['height']} and can't be "
+                                           f"scaled to {width}×{height} without stretching or upscaling – all frames must have "
+                                           f"the first frame's aspect ratio and be at least its scaled size")
+                rgb, alpha = load_frame(indices[slot], size)
+                if tuple(rgb.shape[:2]) != (height, width):
+                    raise RuntimeError(f"Frame {files[indices[slot]].name} is {rgb.shape[1]}×{rgb.shape[0]}, "
+                                       f"expected {width}×{height} – all frames must have the same size")
+                if disk is not None:
+                    disk.store(*frame_key(indices[slot]), rgb, alpha)
+                    return
+                # uint8 → float32 straight into the batch slot
+                batch_rgb[slot].copy_(torch.from_numpy(rgb)).div_(255.0)
+                if alpha is None:
+                    batch_alpha[slot].fill_(fallback_alpha_value)
+                else:
+                    batch_alpha[slot].copy_(torch.from_numpy(alpha)).div_(255.0)
+
+            # With the disk cache only frames it doesn't hold yet are decoded
+            slots = range(len(indices))
+            if disk is not None:
+                missing = {key for key, _ in disk.missing([frame_key(i) for i in indices])}
+                slots = [slot for slot, i in enumerate(indices) if index.files[i] in missing]
+                print(f"[SequenceWrangler] Disk cache: {len(indices) - len(slots)} of {len(indices)} frames cached")
+
+            # PIL releases the GIL while decoding, so frames decode in parallel
+            workers = min(len(slots), Decode_workers or os.cpu_count() or 1)
+            if workers <= 1:
+                for slot in slots:
+                    decode(slot)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(decode, slots))
+            if disk is not None:
+                disk.read_into([index.files[i] for i in indices], batch_rgb, batch_alpha, fallback_alpha_value)
+            return batch_rgb, batch_alpha
 
-        rgb_list, alpha_list = [], []
+        batch_rgb = batch_alpha = None
+        frame_cache.begin(Frame_cache_MB, Free_frame_cache)
 
         if Load_Mode == "All":
-            rgb_list, alpha_list = extract_frames(0, total_frames)
+            batch_rgb, batch_alpha = extract_frames(0, total_frames)
         elif Load_Mode == "From_first_to_Index_1":
             if Index_1 < 0 or Index_1 >= total_frames:
                 raise IndexError(f"Index_1 {Index_1} out of range [0, {total_frames-1}]")
-            rgb_list, alpha_list = extract_frames(0, Index_1 + 1)
+            batch_rgb, batch_alpha = extract_frames(0, Index_1 + 1)
         elif Load_Mode == "From_Index_1_to_last":
             if Index_1 < 0 or Index_1 >= total_frames:
                 raise IndexError(f"Index_1 {Index_1} out of range")
-            rgb_list, alpha_list = extract_frames(Index_1, total_frames)
+            batch_rgb, batch_alpha = extract_frames(Index_1, total_frames)
         elif Load_Mode == "Index_1_to_Index_2":
             s, e = sorted([Index_1, Index_2])
             if s >= total_frames:
                 raise IndexError("Both indices out of range")
             e = min(e, total_frames - 1)
-            rgb_list, alpha_list = extract_frames(s, e + 1)
+            batch_rgb, batch_alpha = extract_frames(s, e + 1)
         elif Load_Mode == "First_frame":
-            rgb_list, alpha_list = extract_frames(0, 1)
+            batch_rgb, batch_alpha = extract_frames(0, 1)
         elif Load_Mode == "Last_frame":
-            rgb_list, alpha_list = extract_frames(total_frames - 1, total_frames)
+            batch_rgb, batch_alpha = extract_frames(total_frames - 1, total_frames)
         elif Load_Mode == "Index_1_frame":
             if Index_1 < 0 or Index_1 >= total_frames:
                 raise IndexError(f"Index_1 {Index_1} out of range")
-            rgb_list, alpha_list = extract_frames(Index_1, Index_1 + 1)
+            batch_rgb, batch_alpha = extract_frames(Index_1, Index_1 + 1)
         else:
             raise ValueError(f"Unknown Load_Mode: {Load_Mode}")
 
-        if not rgb_list:
+        if batch_rgb is None:
             raise RuntimeError("No frames selected")
 
-        batch_rgb = torch.stack(rgb_list)
-        batch_alpha = torch.stack(alpha_list)
-        split_count = len(rgb_list)
+        split_count = batch_rgb.shape[0]
+        frame_cache.report("SequenceWrangler", Frame_cache_MB)
 
         return (batch_rgb, batch_alpha, total_frames, split_count)
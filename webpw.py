@@ -4,6 +4,7 @@ import torch
 from PIL import Image
 import numpy as np
 import webp
+from . import frame_cache
 
 class FossielWebPWrangler:
     @classmethod
@@ -22,6 +23,10 @@ class FossielWebPWrangler:
                 ], {"default": "All"}),
                 "Index_1": ("INT", {"default": 0, "min": 0, "max": 10000}),
                 "Index_2": ("INT", {"default": 0, "min": 0, "max": 10000}),
+                "Frame_cache_MB": ("INT", {"default": 0, "min": 0, "max": 65536, "step": 256, "tooltip": "Keep decoded frames in RAM across runs (shared with Sequence Wrangler, 0 = off for this node). The shared cache keeps the largest budget any loader asked for. Re-loading overlapping ranges only decodes new frames"}),
+                "Decode_max_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8, "tooltip": "Downscale while decoding so the longest side is at most this (0 = off)"}),
+                "Disk_cache": ("BOOLEAN", {"default": False, "tooltip": "Keep decoded frames in a memory-mapped file in the ComfyUI user directory (uncompressed – W×H×4 bytes per frame). Reloads skip decoding; a changed file invalidates it"}),
+                "Free_frame_cache": ("BOOLEAN", {"default": False, "tooltip": "Drop every frame in the shared RAM frame cache (all loaders) before this load, and reset its budget"}),
             }
         }
 
@@ -49,7 +54,8 @@ class FossielWebPWrangler:
         except Exception:
             return 10.0
 
-    def load_webp_sequence(self, WebP_Path: str, Load_Mode: str, Index_1: int, Index_2: int):
+    def load_webp_sequence(self, WebP_Path: str, Load_Mode: str, Index_1: int, Index_2: int, Frame_cache_MB: int = 0,
+                           Disk_cache: bool = False, Decode_max_side: int = 0, Free_frame_cache: bool = False):
         if not WebP_Path:
             raise ValueError("WebP path is required")
         WebP_Path = os.path.expanduser(WebP_Path)
@@ -67,6 +73,7 @@ class FossielWebPWrangler:
         if not getattr(webp, "is_animated", False) or webp.n_frames <= 1:
             webp.seek(0)
             img = webp.convert("RGBA")
+            img = frame_cache.downscale(img, frame_cache.decode_size(*img.size, Decode_max_side))
             arr = np.array(img).astype(np.float32) / 255.0
             rgb = arr[..., :3]
             alpha = arr[..., 3]
@@ -80,55 +87,89 @@ class FossielWebPWrangler:
 
         total_frames = webp.n_frames
 
+        file_stat = os.stat(WebP_Path)
+        mtime = file_stat.st_mtime_ns
+        # Decode-time scaling: each frame is reduced/resized in the decoder loop, before any float conversion
+        width, height = frame_cache.decode_size(*webp.size, Decode_max_side)
+        size = (width, height) if (width, height) != webp.size else None
+
         def extract_frames(start: int, end: int):
-            rgb_frames = []
-            alpha_frames = []
+            indices = range(max(0, start), min(end, total_frames))
+            if not indices:
+                return None, None
+            batch_rgb = torch.empty((len(indices), height, width, 3), dtype=torch.float32)
+            batch_alpha = torch.empty((len(indices), height, width), dtype=torch.float32)
+            disk = None
+            if Disk_cache:
+                source = os.path.abspath(WebP_Path)
+                disk = frame_cache.DiskFrameCache(source if size is None else f"{source}@{width}x{height}", height, width)
+                disk.prune(str(f) for f in range(total_frames))
+            # One file holds every frame, so its size/mtime is each frame's fingerprint
+            file_fp = [file_stat.st_size, mtime]
             with Image.open(WebP_Path) as img:
-                for f in range(max(0, start), min(end, total_frames)):
+                def decode(f: int):
                     img.seek(f)
                     frame = img.convert("RGBA")
-                    arr = np.array(frame).astype(np.float32) / 255.0
-                    rgb_frames.append(torch.from_numpy(arr[..., :3]))
+                    arr = np.array(frame if size is None else frame_cache.downscale(frame, size))
                     alpha = arr[..., 3]
-                    if np.allclose(alpha, 1.0) or np.allclose(alpha, 0.0):
-                        alpha = np.ones_like(alpha)
-                    alpha_frames.append(torch.from_numpy(alpha))
-            return rgb_frames, alpha_frames
+                    # Solid alpha (all 0 or all 1) counts as no alpha → opaque
+                    if alpha.min() == 255 or alpha.max() == 0:
+                        alpha = None
+                    return arr[..., :3], alpha
+
+                # One forward pass over the frames the caches don't hold. The animation decoder can't
+                # skip ahead, so reaching a new frame still decodes every frame before it; cached
+                # frames only save their conversion, unless every frame of the range is cached
+                todo = indices if disk is None else [int(key) for key, _ in disk.missing([(str(f), file_fp) for f in indices])]
+                for f in todo:
+                    rgb, alpha = frame_cache.cached_frame((WebP_Path, mtime, f, size), lambda: decode(f), Frame_cache_MB)
+                    if disk is not None:
+                        disk.store(str(f), file_fp, rgb, alpha)
+                        continue
+                    slot = f - indices.start
+                    batch_rgb[slot].copy_(torch.from_numpy(rgb)).div_(255.0)
+                    if alpha is None:
+                        batch_alpha[slot].fill_(1.0)
+                    else:
+                        batch_alpha[slot].copy_(torch.from_numpy(alpha)).div_(255.0)
+            if disk is not None:
+                disk.read_into([str(f) for f in indices], batch_rgb, batch_alpha, 1.0)
+            return batch_rgb, batch_alpha
 
-        rgb_list, alpha_list = [], []
+        batch_rgb = batch_alpha = None
+        frame_cache.begin(Frame_cache_MB, Free_frame_cache)
 
         if Load_Mode == "All":
-            rgb_list, alpha_list = extract_frames(0, total_frames)
+            batch_rgb, batch_alpha = extract_frames(0, total_frames)
         elif Load_Mode == "From_first_to_Index_1":
             if Index_1 < 0 or Index_1 >= total_frames:
                 raise IndexError(f"Index_1 {Index_1} out of range [0, {total_frames-1}]")
-            rgb_list, alpha_list = extract_frames(0, Index_1 + 1)
+            batch_rgb, batch_alpha = extract_frames(0, Index_1 + 1)
         elif Load_Mode == "From_Index_1_to_last":
             if Index_1 < 0 or Index_1 >= total_frames:
                 raise IndexError(f"Index_1 {Index_1} out of range")
-            rgb_list, alpha_list = extract_frames(Index_1, total_frames)
+            batch_rgb, batch_alpha = extract_frames(Index_1, total_frames)
         elif Load_Mode == "Index_1_to_Index_2":
             s, e = sorted([Index_1, Index_2])
             if s >= total_frames:
                 raise IndexError("Both indices out of range")
             e = min(e, total_frames - 1)
-            rgb_list, alpha_list = extract_frames(s, e + 1)
+            batch_rgb, batch_alpha = extract_frames(s, e + 1)
         elif Load_Mode == "First_frame":
-            rgb_list, alpha_list = extract_frames(0, 1)
+            batch_rgb, batch_alpha = extract_frames(0, 1)
         elif Load_Mode == "Last_frame":
-            rgb_list, alpha_list = extract_frames(total_frames - 1, total_frames)
+            batch_rgb, batch_alpha = extract_frames(total_frames - 1, total_frames)
         elif Load_Mode == "Index_1_frame":
             if Index_1 < 0 or Index_1 >= total_frames:
                 raise IndexError(f"Index_1 {Index_1} out of range")
-            rgb_list, alpha_list = extract_frames(Index_1, Index_1 + 1)
+            batch_rgb, batch_alpha = extract_frames(Index_1, Index_1 + 1)
         else:
             raise ValueError(f"Unknown Load_Mode: {Load_Mode}")
 
-        if not rgb_list:
+        if batch_rgb is None:
             raise RuntimeError("No frames selected")
 
-        batch_rgb = torch.stack(rgb_list)
-        batch_alpha = torch.stack(alpha_list)
-        split_count = len(rgb_list)
+        split_count = batch_rgb.shape[0]
+        frame_cache.report("WebPWrangler", Frame_cache_MB)
 
         return (batch_rgb, batch_alpha, total_frames, split_count, float(rounded_fps))